@@ -6,9 +6,19 @@ from flask import Flask
 
 app = Flask(__name__, static_url_path='/static')
 
+# Sérialisation JSON rapide (numpy natif) et compression négociée des réponses
+from app.services.response_encoder import NumpyJSONProvider, compress_response
+
+app.json = NumpyJSONProvider(app)
+app.after_request(compress_response)
+
 # Importer et enregistrer les blueprints
 from app.controllers.indexcontroller import index_bp
 from app.controllers.analyzecontroller import analyze_bp
+from app.controllers.admincontroller import admin_bp
+from app.controllers.librarycontroller import library_bp
 
 app.register_blueprint(index_bp)
-app.register_blueprint(analyze_bp)
\ No newline at end of file
+app.register_blueprint(analyze_bp)
+app.register_blueprint(admin_bp)
+app.register_blueprint(library_bp)
\ No newline at end of file
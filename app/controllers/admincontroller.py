@@ -0,0 +1,249 @@
+"""
+Contrôleur Flask pour les endpoints d'administration (profils d'analyse, reclassification).
+"""
+from flask import Blueprint, request, jsonify, send_file, Response
+import hmac
+import math
+import os
+import time
+import numpy as np
+from app.services.request_profiler import ProfileStore
+from app.services.batch_classifier import BatchClassifier
+from app.services.section_detector import CLASSIFICATION_THRESHOLDS
+from app.services.visualizer_mapper import VisualizerMapper
+from app.controllers.librarycontroller import analysis_library
+
+
+admin_bp = Blueprint('admin', __name__)
+
+# Configuration
+PROFILE_FOLDER = os.path.join('temp', 'profiles')
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+profile_store = ProfileStore(PROFILE_FOLDER)
+
+
+def is_admin_request():
+    """Vérifie le token admin (header X-Admin-Token). Désactivé si ADMIN_TOKEN est vide."""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def profiling_requested():
+    """Profilage demandé (header X-Profile: 1 ou ?profile=1) par un admin authentifié."""
+    requested = request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+    return requested and is_admin_request()
+
+
+@admin_bp.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """
+    Liste les profils d'analyse enregistrés.
+
+    Returns:
+        JSON avec les métadonnées des profils (id, fichier, format, durée...)
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Non autorisé'}), 403
+
+    return jsonify({
+        'success': True,
+        'profiles': profile_store.list_profiles()
+    }), 200
+
+
+@admin_bp.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    Récupère un profil d'analyse.
+
+    Query params:
+        format: 'text' (rapport pstats, défaut), 'json' (métadonnées) ou 'raw' (.prof)
+        sort: Clé de tri pstats (cumulative, tottime, ...)
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Non autorisé'}), 403
+
+    metadata = profile_store.get_metadata(profile_id)
+    if metadata is None:
+        return jsonify({'error': 'Profil introuvable'}), 404
+
+    output_format = request.args.get('format', 'text')
+
+    if output_format == 'json':
+        return jsonify({'success': True, 'profile': metadata}), 200
+
+    if output_format == 'raw':
+        return send_file(
+            os.path.abspath(profile_store.get_raw_path(profile_id)),
+            mimetype='application/octet-stream',
+            as_attachment=True,
+            download_name=f"{profile_id}.prof"
+        )
+
+    try:
+        report = profile_store.get_report(profile_id, sort_by=request.args.get('sort', 'cumulative'))
+    except KeyError:
+        return jsonify({'error': 'Clé de tri invalide'}), 400
+
+    return Response(report, mimetype='text/plain'), 200
+
+
+@admin_bp.route('/api/admin/reclassify', methods=['POST'])
+def reclassify_library():
+    """
+    Reclassifie toutes les sections de la bibliothèque avec de nouveaux seuils.
+
+    Expected JSON:
+        {
+            "thresholds": {"loud_energy": 0.11, "chorus_brightness": 2200},
+            "drops": false,   # Recalculer aussi les drops (lit les features stockées)
+            "apply": false    # Enregistrer le résultat (sinon simulation)
+        }
+
+    Les seuils envoyés surchargent les seuils actifs de la bibliothèque; avec
+    apply, le résultat devient le nouveau jeu de seuils actif, utilisé aussi
+    par /api/analyze pour les nouvelles analyses.
+
+    Les drops ne sont recalculés que pour les morceaux dont l'enveloppe RMS
+    est stockée sans perte (float32); les autres sont comptés dans
+    'skipped_drop_tracks' et gardent leurs drops.
+
+    Returns:
+        JSON avec la répartition des types avant/après et le nombre de changements
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Non autorisé'}), 403
+
+    if analysis_library is None:
+        return jsonify({'error': 'Bibliothèque désactivée'}), 404
+
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Objet JSON attendu'}), 400
+
+    thresholds = data.get('thresholds', {})
+    if not isinstance(thresholds, dict):
+        return jsonify({'error': '"thresholds" doit être un objet {nom: valeur}'}), 400
+
+    unknown = set(thresholds) - set(CLASSIFICATION_THRESHOLDS)
+    if unknown:
+        return jsonify({'error': f'Seuils inconnus: {", ".join(sorted(unknown))}'}), 400
+
+    try:
+        thresholds = {name: _parse_threshold(value) for name, value in thresholds.items()}
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Les seuils doivent être des nombres finis'}), 400
+
+    timings = {}
+    start = time.time()
+    table = analysis_library.load_section_table()
+    timings['load'] = time.time() - start
+
+    classifier = BatchClassifier({**analysis_library.get_thresholds(), **thresholds})
+    start = time.time()
+    types = classifier.classify_and_refine(table)
+    timings['classify'] = time.time() - start
+
+    drops = None
+    skipped_drop_tracks = 0
+    if data.get('drops'):
+        start = time.time()
+        drops, skipped_drop_tracks = _reclassify_drops(classifier, list(dict.fromkeys(table['track'])))
+        timings['drops'] = time.time() - start
+
+    changed = types != table['type']
+    updated_tracks = 0
+    if data.get('apply'):
+        start = time.time()
+        updated_tracks = analysis_library.update_classifications(
+            table, types, drops, rebuild_result=_rebuild_result, thresholds=classifier.thresholds
+        )
+        timings['apply'] = time.time() - start
+
+    return jsonify({
+        'success': True,
+        'applied': bool(data.get('apply')),
+        'thresholds': classifier.thresholds,
+        'tracks': len(set(table['track'])),
+        'sections': len(types),
+        'changed_sections': int(np.sum(changed)),
+        'changed_tracks': len(set(table['track'][changed])),
+        'types_before': _count_types(table['type']),
+        'types_after': _count_types(types),
+        'total_drops': sum(len(times) for times in drops.values()) if drops is not None else None,
+        'skipped_drop_tracks': skipped_drop_tracks,
+        'updated_tracks': updated_tracks,
+        'timings': {name: round(seconds, 3) for name, seconds in timings.items()}
+    }), 200
+
+
+def _parse_threshold(value):
+    """Valeur de seuil: nombre fini (les booléens sont refusés)."""
+    if isinstance(value, bool):
+        raise TypeError('booléen')
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError('non fini')
+    return number
+
+
+def _reclassify_drops(classifier, track_ids):
+    """
+    Recalcule les drops à partir des enveloppes RMS stockées, morceau par
+    morceau (seule l'enveloppe est lue et gardée en mémoire le temps du calcul).
+
+    Returns:
+        tuple: ({track_id: temps des drops}, nombre de morceaux ignorés car
+               leur enveloppe a été stockée en float16)
+    """
+    drops = {}
+    skipped = 0
+    for track_id in track_ids:
+        envelope = analysis_library.load_envelope(track_id)
+        if envelope is None:
+            continue
+        if envelope['rms'].dtype != np.float32:
+            skipped += 1
+            continue
+        drops[track_id] = classifier.detect_drops(
+            [envelope['rms']], [envelope['sr']], [envelope['hop_length']]
+        )[0]
+    return drops, skipped
+
+
+def _rebuild_result(track_id, result):
+    """
+    Régénère la timeline et les keyframes d'un résultat reclassifié.
+
+    Les sections dont le type n'a pas changé gardent leurs shaders (tirés au
+    hasard à l'analyse): seuls les visuels des sections reclassifiées changent.
+    """
+    mapper = VisualizerMapper()
+    previous = {entry['section_index']: entry for entry in result.get('visualization_timeline', [])}
+    timeline = mapper.get_visualization_timeline(result['sections'], result['tempo'])
+    for entry in timeline:
+        old = previous.get(entry['section_index'])
+        if old is not None and old['section_type'] == entry['section_type']:
+            entry['shader_index'] = old['shader_index']
+            entry['shader_pair'] = old['shader_pair']
+    result['visualization_timeline'] = timeline
+
+    envelope = analysis_library.load_envelope(track_id)
+    if envelope is not None and 'beat_keyframes' in result:
+        result['beat_keyframes'] = mapper.get_beat_keyframes(timeline, {
+            'beat_times': result['beat_times'],
+            'rms': envelope['rms'],
+            'sr': envelope['sr'],
+            'hop_length': envelope['hop_length'],
+            'tempo': result['tempo'],
+        })
+    return result
+
+
+def _count_types(types):
+    """Compte les sections par type."""
+    values, counts = np.unique(np.asarray(types, dtype=str), return_counts=True)
+    return {str(value): int(count) for value, count in zip(values, counts)}
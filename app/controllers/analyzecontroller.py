@@ -5,9 +5,18 @@ from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 import os
 import time
+import hashlib
+import numpy as np
+from contextlib import nullcontext
 from app.services.music_analyzer import MusicAnalyzer
 from app.services.section_detector import SectionDetector
 from app.services.visualizer_mapper import VisualizerMapper
+from app.services.admission_controller import AdmissionController, AdmissionRejected
+from app.services import warmup
+from app.services.response_encoder import compact_beat_times, quantize_floats
+from app.controllers.admincontroller import profile_store, profiling_requested
+from app.services.similarity_index import build_summary_vector
+from app.controllers.librarycontroller import analysis_library
 
 
 analyze_bp = Blueprint('analyze', __name__)
@@ -15,10 +24,15 @@ analyze_bp = Blueprint('analyze', __name__)
 # Configuration
 TEMP_FOLDER = 'temp'
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'ogg', 'm4a', 'flac', 'aac'}
+# À incrémenter quand le format ou le contenu de la réponse change (invalide les ETags de la bibliothèque)
+ANALYSIS_VERSION = '5'
 
 # S'assurer que le dossier temp existe
 os.makedirs(TEMP_FOLDER, exist_ok=True)
 
+# Contrôle d'admission partagé par les threads du worker
+admission_controller = AdmissionController()
+
 
 def allowed_file(filename):
     """Vérifie si l'extension du fichier est autorisée."""
@@ -34,6 +48,8 @@ def analyze_audio():
     Returns:
         JSON avec tempo, sections, et timeline de visualisation
     """
+    request_start = time.time()
+    
     # Vérifier qu'un fichier est présent
     if 'audio' not in request.files:
         return jsonify({'error': 'Aucun fichier audio fourni'}), 400
@@ -54,84 +70,153 @@ def analyze_audio():
     temp_filename = f"{timestamp}_{filename}"
     temp_path = os.path.join(TEMP_FOLDER, temp_filename)
     
+    # Empreinte du contenu: identifiant du morceau dans la bibliothèque, où le
+    # résultat se revalide ensuite en GET (ETag) sans ré-upload
+    compact = request.args.get('compact') == '1'
+    stereo = request.args.get('stereo') == '1'
+    track_id = _hash_upload(audio_file.stream)
+    
+    # Estimer le coût avant tout décodage (taille + durée annoncée par le client)
+    cost = admission_controller.estimate_cost(
+        request.content_length,
+        filename.rsplit('.', 1)[-1].lower(),
+        request.headers.get('X-Audio-Duration'),
+        stereo=stereo
+    )
+    
     try:
         print(f"\n{'='*60}")
         print(f"Nouvelle analyse: {filename}")
         print(f"{'='*60}")
         
-        audio_file.save(temp_path)
-        print(f"Fichier sauvegardé: {temp_path}")
-        
-        # 1. Analyser les features audio (mode TRÈS rapide pour éviter timeout Render)
-        analyzer = MusicAnalyzer(fast_mode=True)
+        # Profilage opt-in (admin uniquement), aucun coût si non demandé. L'analyse
+        # profilée s'exécute seule sur le worker: cProfile (sys.monitoring,
+        # Python 3.12) enregistre tous les threads de l'interpréteur
+        profiling = profiling_requested()
+        profile_session = profile_store.session(filename) if profiling else nullcontext({})
         
-        # Limiter la durée d'analyse à 20s max (Render timeout = 30s)
-        import signal
-        
-        def timeout_handler(signum, frame):
-            raise TimeoutError("Analyse trop longue (timeout 20s)")
-        
-        # Sur Windows, signal.alarm n'existe pas, donc on skip
-        analysis_start = time.time()
-        
-        try:
-            features = analyzer.analyze(temp_path)
-            analysis_duration = time.time() - analysis_start
-            print(f"⏱️ Analyse terminée en {analysis_duration:.1f}s")
-        except Exception as e:
-            # Si l'analyse prend trop de temps, mode dégradé
-            print(f"⚠️ Analyse échouée ou trop longue, mode dégradé activé")
-            return jsonify({
+        with admission_controller.admit(cost, exclusive=profiling) as admission, profile_session as profile_info:
+            profile_info['concurrent_analyses'] = admission_controller.get_stats()['running'] - 1
+            audio_file.save(temp_path)
+            print(f"Fichier sauvegardé: {temp_path}")
+            
+            # 1. Analyser les features audio (mode TRÈS rapide pour éviter timeout Render)
+            analyzer = MusicAnalyzer(fast_mode=True, stereo=stereo)
+            
+            # Limiter la durée d'analyse à 20s max (Render timeout = 30s)
+            import signal
+            
+            def timeout_handler(signum, frame):
+                raise TimeoutError("Analyse trop longue (timeout 20s)")
+            
+            # Sur Windows, signal.alarm n'existe pas, donc on skip
+            analysis_start = time.time()
+            
+            try:
+                features = analyzer.analyze(temp_path)
+                admission['duration'] = features['duration']
+                analysis_duration = time.time() - analysis_start
+                print(f"⏱️ Analyse terminée en {analysis_duration:.1f}s")
+                profile_info['duration'] = features['duration']
+            except Exception as e:
+                # Si l'analyse prend trop de temps, mode dégradé
+                print(f"⚠️ Analyse échouée ou trop longue, mode dégradé activé")
+                return jsonify({
+                    'success': True,
+                    'degraded_mode': True,
+                    'message': 'Analyse simplifiée (fichier trop long)',
+                    'filename': filename,
+                    'duration': 0,
+                    'tempo': 120,
+                    'beat_times': [],
+                    'sections': [],
+                    'drops': [],
+                    'visualization_timeline': []
+                }), 200
+            
+            # 2. Détecter les sections (nombre automatique basé sur la durée), avec
+            # les seuils actifs de la bibliothèque (éventuellement reclassifiée)
+            detector = SectionDetector(n_sections=None, thresholds=_get_active_thresholds())
+            sections = detector.detect_sections(features)
+            
+            # 3. Détecter les drops (optionnel, pour EDM)
+            drops = detector.detect_drops(features, sections)
+            
+            # Convertir les drops en liste Python (pas numpy)
+            if hasattr(drops, 'tolist'):
+                drops = drops.tolist()
+            
+            # 4. Mapper aux visualiseurs
+            mapper = VisualizerMapper()
+            timeline = mapper.get_visualization_timeline(sections, features['tempo'])
+            keyframes = mapper.get_beat_keyframes(timeline, features)
+            
+            # 5. Préparer la réponse
+            response = {
                 'success': True,
-                'degraded_mode': True,
-                'message': 'Analyse simplifiée (fichier trop long)',
+                'track_id': track_id,
                 'filename': filename,
-                'duration': 0,
-                'tempo': 120,
-                'beat_times': [],
-                'sections': [],
-                'drops': [],
-                'visualization_timeline': []
-            }), 200
-        
-        # 2. Détecter les sections (nombre automatique basé sur la durée)
-        detector = SectionDetector(n_sections=None)  # Auto-detect
-        sections = detector.detect_sections(features)
-        
-        # 3. Détecter les drops (optionnel, pour EDM)
-        drops = detector.detect_drops(features, sections)
-        
-        # Convertir les drops en liste Python (pas numpy)
-        if hasattr(drops, 'tolist'):
-            drops = drops.tolist()
-        
-        # 4. Mapper aux visualiseurs
-        mapper = VisualizerMapper()
-        timeline = mapper.get_visualization_timeline(sections, features['tempo'])
-        
-        # 5. Préparer la réponse
-        response = {
-            'success': True,
-            'filename': filename,
-            'duration': features['duration'],
-            'tempo': features['tempo'],
-            'beat_times': features['beat_times'],
-            'sections': sections,
-            'drops': drops,
-            'visualization_timeline': timeline,
-            'stats': {
-                'total_sections': len(sections),
-                'section_types': _get_section_type_counts(sections)
+                'duration': features['duration'],
+                'tempo': features['tempo'],
+                'beat_times': features['beat_times'],
+                'sections': sections,
+                'drops': drops,
+                'visualization_timeline': timeline,
+                'beat_keyframes': keyframes,
+                'stats': {
+                    'total_sections': len(sections),
+                    'section_types': _get_section_type_counts(sections)
+                }
             }
-        }
-        
-        print(f"\n{'='*60}")
-        print("Analyse terminée avec succès!")
-        print("Durée: {:.1f}s | Tempo: {:.1f} BPM".format(features['duration'], features['tempo']))
-        print("Sections: {} | Drops: {}".format(len(sections), len(drops)))
-        print(f"{'='*60}\n")
-        
-        return jsonify(response), 200
+            
+            # Enveloppes stéréo optionnelles (?stereo=1), une valeur par frame d'analyse
+            if stereo:
+                response['stereo'] = _get_stereo_envelopes(features)
+            
+            # Conserver l'analyse complète dans la bibliothèque (consultable par track_id)
+            saved = False
+            if analysis_library is not None:
+                try:
+                    analysis_library.save(
+                        track_id, filename, features, sections, drops, response, ANALYSIS_VERSION,
+                        summary_vector=build_summary_vector(features, sections),
+                        thresholds=detector.thresholds
+                    )
+                    saved = True
+                except Exception as e:
+                    print(f"⚠️ Impossible d'enregistrer l'analyse dans la bibliothèque: {e}")
+            
+            # Représentation compacte optionnelle (?compact=1): beats en deltas
+            # quantifiés à la milliseconde et floats arrondis
+            if compact:
+                beat_times = response.pop('beat_times')
+                response = quantize_floats(response)
+                response['beat_times_compact'] = compact_beat_times(beat_times)
+            
+            print(f"\n{'='*60}")
+            print("Analyse terminée avec succès!")
+            print("Durée: {:.1f}s | Tempo: {:.1f} BPM".format(features['duration'], features['tempo']))
+            print("Sections: {} | Drops: {}".format(len(sections), len(drops)))
+            print(f"{'='*60}\n")
+            
+            http_response = jsonify(response)
+            # Ressource GET revalidable, seulement si ce corps est exactement celui qu'elle renvoie
+            if saved and not compact:
+                http_response.headers['Content-Location'] = f"/api/library/{track_id}"
+            if profile_info.get('id'):
+                http_response.headers['X-Profile-Id'] = profile_info['id']
+            
+            # Latence de première requête: analyses complètes uniquement (ni 503 ni mode dégradé)
+            warmup.record_request(time.time() - request_start)
+            return http_response, 200
+    
+    except AdmissionRejected as e:
+        print(f"⚠️ Requête rejetée ({e}), retry dans {e.retry_after}s")
+        return jsonify({
+            'success': False,
+            'error': f'Serveur surchargé: {str(e)}',
+            'retry_after': e.retry_after
+        }), 503, {'Retry-After': str(e.retry_after)}
     
     except Exception as e:
         print(f"\n❌ ERREUR lors de l'analyse: {str(e)}")
@@ -193,6 +278,56 @@ def suggest_shader():
         }), 500
 
 
+@analyze_bp.route('/api/startup-stats', methods=['GET'])
+def startup_stats():
+    """
+    Statistiques de démarrage du worker courant.
+    
+    Returns:
+        JSON avec durées d'import, de warm-up et latence de la première analyse
+    """
+    return jsonify({
+        'success': True,
+        'startup': warmup.get_stats(),
+        'admission': admission_controller.get_stats()
+    }), 200
+
+
+def _hash_upload(stream):
+    """Empreinte du fichier uploadé (identifiant du morceau dans la bibliothèque)."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()[:32]
+
+
+def _get_active_thresholds():
+    """Seuils de classification actifs de la bibliothèque (None: seuils par défaut)."""
+    if analysis_library is None:
+        return None
+    try:
+        return analysis_library.get_thresholds()
+    except Exception as e:
+        print(f"⚠️ Seuils de la bibliothèque illisibles, seuils par défaut: {e}")
+        return None
+
+
+def _get_stereo_envelopes(features):
+    """Prépare les enveloppes stéréo pour la réponse JSON (arrondies à 1e-3)."""
+    stereo = features['stereo']
+    envelopes = {
+        name: np.round(stereo[name], 3)
+        for name in ('left_energy', 'right_energy', 'mid_energy', 'side_energy', 'balance', 'width')
+    }
+    envelopes['width_bands'] = {
+        name: np.round(values, 3) for name, values in stereo['width_bands'].items()
+    }
+    envelopes['is_stereo'] = stereo['is_stereo']
+    envelopes['frame_rate'] = features['sr'] / features['hop_length']
+    return envelopes
+
+
 def _get_section_type_counts(sections):
     """Compte le nombre de sections par type."""
     counts = {}
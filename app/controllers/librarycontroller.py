@@ -0,0 +1,180 @@
+"""
+Contrôleur Flask pour la bibliothèque d'analyses.
+"""
+from flask import Blueprint, Response, request, jsonify
+import math
+import os
+from app.services.analysis_library import AnalysisLibrary
+from app.services.similarity_index import SimilarityIndex
+from app.services.visualizer_mapper import VisualizerMapper
+
+
+library_bp = Blueprint('library', __name__)
+
+# Configuration
+LIBRARY_FOLDER = os.environ.get('LIBRARY_FOLDER', 'library')
+MAX_RESULTS = 500
+MAX_NEIGHBOURS = 100
+
+# Bibliothèque partagée (désactivable avec LIBRARY_ENABLED=0)
+analysis_library = AnalysisLibrary(LIBRARY_FOLDER) if os.environ.get('LIBRARY_ENABLED', '1') != '0' else None
+similarity_index = SimilarityIndex(analysis_library) if analysis_library is not None else None
+
+
+@library_bp.route('/api/library', methods=['GET'])
+def search_library():
+    """
+    Recherche des morceaux analysés.
+    
+    Query params:
+        tempo_min, tempo_max: Bornes de tempo (BPM)
+        min_drops: Nombre minimum de drops
+        sections: Composition minimale, ex. "drop:2,chorus:1"
+        limit, offset: Pagination (limit entre 1 et 500)
+    
+    Returns:
+        JSON avec la liste des morceaux (id, tempo, durée, composition...),
+        400 si un paramètre n'est pas un nombre valide
+    """
+    if analysis_library is None:
+        return jsonify({'error': 'Bibliothèque désactivée'}), 404
+    
+    try:
+        tempo_min = _get_number('tempo_min', float)
+        tempo_max = _get_number('tempo_max', float)
+        min_drops = _get_number('min_drops', int)
+        limit = max(1, min(MAX_RESULTS, _get_number('limit', int, 50)))
+        offset = max(0, _get_number('offset', int, 0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        section_counts = _parse_section_counts(request.args.get('sections', ''))
+    except ValueError:
+        return jsonify({'error': 'Paramètre "sections" invalide (format: type:min,type:min)'}), 400
+    
+    tracks = analysis_library.search(
+        tempo_min=tempo_min,
+        tempo_max=tempo_max,
+        min_drops=min_drops,
+        section_counts=section_counts,
+        limit=limit,
+        offset=offset
+    )
+    
+    return jsonify({
+        'success': True,
+        'count': len(tracks),
+        'tracks': tracks
+    }), 200
+
+
+@library_bp.route('/api/library/<track_id>', methods=['GET'])
+def get_analysis(track_id):
+    """
+    Récupère une analyse enregistrée sans ré-upload du fichier.
+    
+    Returns:
+        JSON identique à la réponse de /api/analyze (304 si l'ETag correspond)
+    """
+    if analysis_library is None:
+        return jsonify({'error': 'Bibliothèque désactivée'}), 404
+    
+    summary = analysis_library.get_summary(track_id)
+    if summary is None:
+        return jsonify({'error': 'Analyse introuvable'}), 404
+    
+    # Révision = génération de la dernière écriture (nouvelle analyse ou reclassification)
+    etag = f"{track_id}-{summary['analysis_version']}-r{summary['revision']}-library"
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+    
+    result = analysis_library.get(track_id)
+    if result is None:
+        return jsonify({'error': 'Analyse introuvable'}), 404
+    
+    response = jsonify(result)
+    response.set_etag(etag, weak=True)
+    return response, 200
+
+
+@library_bp.route('/api/library/<track_id>/similar', methods=['GET'])
+def similar_tracks(track_id):
+    """
+    Suggère les morceaux (et thèmes visuels) les plus proches d'un morceau.
+    
+    Query params:
+        k: Nombre de suggestions (défaut 10, max 100)
+    
+    Returns:
+        JSON avec les morceaux similaires, leur score cosinus et le thème
+        visuel associé à leur type de section dominant
+    """
+    if similarity_index is None:
+        return jsonify({'error': 'Bibliothèque désactivée'}), 404
+    
+    try:
+        k = max(1, min(MAX_NEIGHBOURS, _get_number('k', int, 10)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    neighbours = similarity_index.query(track_id, k)
+    if neighbours is None:
+        return jsonify({'error': 'Morceau non indexé'}), 404
+    
+    scores = dict(neighbours)
+    summaries = analysis_library.get_summaries([neighbour_id for neighbour_id, _ in neighbours])
+    
+    mapper = VisualizerMapper()
+    for summary in summaries:
+        summary['score'] = round(scores[summary['id']], 4)
+        summary['suggested_theme'] = _get_theme(mapper, summary['section_types'])
+    
+    return jsonify({
+        'success': True,
+        'track_id': track_id,
+        'similar': summaries
+    }), 200
+
+
+def _get_theme(mapper, section_types):
+    """Thème visuel correspondant au type de section dominant d'un morceau."""
+    if not section_types:
+        return None
+    dominant = max(section_types, key=section_types.get)
+    config = mapper.get_config_for_section_type(dominant)
+    return {
+        'section_type': dominant,
+        'shaders': config['shaders'],
+        'intensity': config['intensity']
+    }
+
+
+def _get_number(name, type_, default=None):
+    """
+    Lit un paramètre numérique de la query string.
+    
+    Raises:
+        ValueError: si le paramètre est présent mais n'est pas un nombre fini
+    """
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = type_(value)
+    except ValueError:
+        raise ValueError(f'Paramètre "{name}" invalide: nombre attendu') from None
+    if not math.isfinite(number):
+        raise ValueError(f'Paramètre "{name}" invalide: nombre fini attendu')
+    return number
+
+
+def _parse_section_counts(value):
+    """Parse "drop:2,chorus:1" en {'drop': 2, 'chorus': 1}."""
+    counts = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        section_type, _, minimum = item.partition(':')
+        counts[section_type] = int(minimum) if minimum else 1
+    return counts
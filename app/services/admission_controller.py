@@ -0,0 +1,262 @@
+"""
+Service de contrôle d'admission pour les analyses audio.
+Estime le coût d'une requête avant décodage et limite la charge CPU/RAM par worker.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+# Débit moyen (octets/seconde d'audio) par format, pour estimer la durée
+# quand le client ne la fournit pas
+BYTES_PER_SECOND = {
+    'wav': 176400,   # PCM 16 bits stéréo 44.1kHz
+    'flac': 100000,  # ~55% du PCM
+    'mp3': 16000,    # ~128 kbps
+    'ogg': 16000,
+    'm4a': 16000,
+    'aac': 16000,
+}
+DEFAULT_BYTES_PER_SECOND = 16000
+
+# Débits plausibles (min, max en octets/seconde) par format: bornent la durée
+# annoncée par le client à ce que la taille du fichier permet
+BYTES_PER_SECOND_RANGE = {
+    'wav': (8000, 1536000),   # 8kHz mono 8 bits → 192kHz stéréo 32 bits
+    'flac': (4000, 1000000),
+    'mp3': (1000, 40000),     # 8 → 320 kbps
+    'ogg': (1000, 64000),
+    'm4a': (1000, 64000),
+    'aac': (1000, 64000),
+}
+DEFAULT_BYTES_PER_SECOND_RANGE = (1000, 1536000)
+
+
+class AdmissionRejected(Exception):
+    """Levée quand une requête est refusée (file pleine ou attente trop longue)."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Contrôle d'admission par coût estimé (CPU et mémoire) pour un worker.
+
+    Les requêtes admises s'exécutent tant que le nombre d'analyses concurrentes
+    et le budget mémoire le permettent. Les autres attendent dans une file FIFO
+    bornée; au-delà, elles sont rejetées immédiatement avec un délai de retry
+    calculé à partir du temps de vidage estimé de la file.
+
+    Chaque requête en file occupe un thread du worker: la file doit tenir dans
+    threads - max_concurrent - 1 (un thread reste libre pour répondre 503),
+    sinon les requêtes en trop attendent dans la file de connexions de
+    gunicorn, invisible et non bornée (cf. configure_threads).
+    """
+
+    def __init__(self, max_concurrent=None, memory_budget_mb=None, max_queue=None,
+                 max_queue_wait=None, sr=22050):
+        """
+        Args:
+            max_concurrent: Nombre max d'analyses simultanées (ANALYSIS_MAX_CONCURRENT)
+            memory_budget_mb: Budget RAM des analyses en Mo (ANALYSIS_MEMORY_BUDGET_MB)
+            max_queue: Nombre max de requêtes en attente (ANALYSIS_MAX_QUEUE)
+            max_queue_wait: Attente max en file en secondes (ANALYSIS_MAX_QUEUE_WAIT)
+            sr: Sample rate utilisé par MusicAnalyzer (pour l'estimation mémoire)
+        """
+        self.max_concurrent = max_concurrent or int(os.environ.get('ANALYSIS_MAX_CONCURRENT', 2))
+        self.memory_budget_mb = memory_budget_mb or float(os.environ.get('ANALYSIS_MEMORY_BUDGET_MB', 768))
+        if max_queue is None and os.environ.get('ANALYSIS_MAX_QUEUE'):
+            max_queue = int(os.environ['ANALYSIS_MAX_QUEUE'])
+        # None: dérivée du nombre de threads du worker (configure_threads)
+        self._requested_queue = max_queue
+        self.max_queue = max_queue if max_queue is not None else 4
+        self.max_queue_wait = max_queue_wait or float(os.environ.get('ANALYSIS_MAX_QUEUE_WAIT', 60))
+        self.sr = sr
+
+        # Secondes de calcul par seconde d'audio (moyenne glissante, ajustée en ligne)
+        self.seconds_per_audio_second = 0.15
+        # Mémoire de travail par seconde d'audio: signal float32 + STFT + features
+        self.mb_per_audio_second = sr * 4 * 12 / 1e6
+
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._queue = deque()
+        self._running = {}
+        self._memory_used = 0.0
+        # Analyse exclusive en cours (profilage): aucune autre ne démarre
+        self._exclusive = False
+
+    def estimate_cost(self, content_length, extension, declared_duration=None, stereo=False):
+        """
+        Estime le coût d'une analyse sans décoder le fichier.
+
+        La durée annoncée par le client n'est qu'un indice: les valeurs non
+        finies sont ignorées et les autres sont ramenées dans l'intervalle
+        compatible avec la taille du fichier et le débit du format.
+
+        Args:
+            content_length: Taille de l'upload en octets (peut être None)
+            extension: Extension du fichier (mp3, wav, ...)
+            declared_duration: Durée annoncée par le client (header X-Audio-Duration)
+            stereo: Analyse stéréo (deux canaux en mémoire, STFT batchée)
+
+        Returns:
+            dict: duration (s), cpu_seconds, memory_mb
+        """
+        size = content_length or 0
+        bytes_per_second = BYTES_PER_SECOND.get(extension, DEFAULT_BYTES_PER_SECOND)
+        duration = size / bytes_per_second
+
+        declared = None
+        if declared_duration:
+            try:
+                declared = float(declared_duration)
+            except (TypeError, ValueError):
+                declared = None
+        if declared is not None and math.isfinite(declared) and declared >= 0:
+            if content_length:
+                min_rate, max_rate = BYTES_PER_SECOND_RANGE.get(extension, DEFAULT_BYTES_PER_SECOND_RANGE)
+                declared = min(max(declared, size / max_rate), size / min_rate)
+            duration = declared
+
+        channels = 2 if stereo else 1
+        return {
+            'duration': duration,
+            'cpu_seconds': duration * self.seconds_per_audio_second * (1.3 if stereo else 1.0),
+            # Plafonné au budget: une requête énorme passe seule plutôt que jamais
+            'memory_mb': min(self.memory_budget_mb, duration * self.mb_per_audio_second * channels),
+        }
+
+    def configure_threads(self, threads):
+        """
+        Aligne les limites sur le nombre de threads du worker gunicorn.
+
+        Appelée par le hook post_worker_init (gunicorn.conf.py). Sans
+        ANALYSIS_MAX_QUEUE, la file vaut threads - max_concurrent - 1; une
+        valeur explicite trop grande est ramenée à cette borne.
+
+        Args:
+            threads: Nombre de threads du worker (--threads)
+        """
+        with self._lock:
+            self.max_concurrent = max(1, min(self.max_concurrent, threads))
+            limit = max(0, threads - self.max_concurrent - 1)
+            if self._requested_queue is not None and self._requested_queue > limit:
+                print(f"⚠️ ANALYSIS_MAX_QUEUE={self._requested_queue} dépasse les threads disponibles, "
+                      f"ramenée à {limit} ({threads} threads, {self.max_concurrent} analyses)")
+            if self._requested_queue is None or self._requested_queue > limit:
+                self.max_queue = limit
+            else:
+                self.max_queue = self._requested_queue
+
+    @contextmanager
+    def admit(self, cost, exclusive=False):
+        """
+        Réserve les ressources pour une analyse, en attendant si nécessaire.
+
+        Fournit un dictionnaire où l'appelant renseigne 'duration' (durée
+        réelle décodée): seule celle-ci sert à ajuster le coût CPU observé.
+
+        Args:
+            cost: Coût estimé (de estimate_cost)
+            exclusive: Attendre que le worker soit vide et s'exécuter seul
+                       (requêtes profilées: cProfile voit tous les threads)
+
+        Raises:
+            AdmissionRejected: si la file est pleine ou l'attente trop longue
+        """
+        ticket = object()
+
+        with self._condition:
+            must_wait = bool(self._queue) or not self._fits(cost, exclusive)
+            if must_wait and len(self._queue) >= self.max_queue:
+                raise AdmissionRejected('File d\'analyse pleine', self._retry_after())
+
+            if must_wait and self._drain_time() > self.max_queue_wait:
+                raise AdmissionRejected('Attente estimée trop longue', self._retry_after())
+
+            self._queue.append((ticket, cost))
+            deadline = time.time() + self.max_queue_wait
+
+            while not (self._queue[0][0] is ticket and self._fits(cost, exclusive)):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._queue.remove((ticket, cost))
+                    self._condition.notify_all()
+                    raise AdmissionRejected('Attente en file expirée', self._retry_after())
+                self._condition.wait(remaining)
+
+            self._queue.popleft()
+            self._running[ticket] = (cost, time.time())
+            self._memory_used += cost['memory_mb']
+            self._exclusive = exclusive
+            # Le suivant peut peut-être démarrer aussi
+            self._condition.notify_all()
+
+        start = time.time()
+        admission = {'duration': None}
+        try:
+            yield admission
+        finally:
+            elapsed = time.time() - start
+            with self._condition:
+                del self._running[ticket]
+                self._memory_used -= cost['memory_mb']
+                if exclusive:
+                    self._exclusive = False
+                if admission['duration'] is not None:
+                    self._record(elapsed, admission['duration'])
+                self._condition.notify_all()
+
+    def get_stats(self):
+        """État courant du contrôleur (pour logs/monitoring)."""
+        with self._lock:
+            return {
+                'running': len(self._running),
+                'exclusive': self._exclusive,
+                'queued': len(self._queue),
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'memory_used_mb': round(self._memory_used, 1),
+                'memory_budget_mb': self.memory_budget_mb,
+                'estimated_drain_time': round(self._drain_time(), 1),
+                'seconds_per_audio_second': round(self.seconds_per_audio_second, 3),
+            }
+
+    def _fits(self, cost, exclusive=False):
+        """Vérifie si une analyse peut démarrer maintenant (verrou tenu)."""
+        if self._exclusive:
+            return False
+        if not self._running:
+            return True
+        if exclusive:
+            return False
+        if len(self._running) >= self.max_concurrent:
+            return False
+        return self._memory_used + cost['memory_mb'] <= self.memory_budget_mb
+
+    def _drain_time(self):
+        """Temps estimé pour vider les analyses en cours et la file (verrou tenu)."""
+        now = time.time()
+        remaining = sum(
+            max(0.0, cost['cpu_seconds'] - (now - started))
+            for cost, started in self._running.values()
+        )
+        remaining += sum(cost['cpu_seconds'] for _, cost in self._queue)
+        return remaining / self.max_concurrent
+
+    def _retry_after(self):
+        """Délai de retry (secondes entières) à renvoyer au client."""
+        return max(1, int(round(self._drain_time())))
+
+    def _record(self, elapsed, duration):
+        """Met à jour le coût CPU observé par seconde d'audio décodée (verrou tenu)."""
+        if not math.isfinite(duration) or duration <= 1.0:
+            return
+        observed = elapsed / duration
+        self.seconds_per_audio_second = 0.8 * self.seconds_per_audio_second + 0.2 * observed
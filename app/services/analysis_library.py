@@ -0,0 +1,520 @@
+"""
+Service de bibliothèque persistante des analyses.
+Stocke chaque morceau analysé dans SQLite (métadonnées indexées, sections)
+et dans des fichiers compacts (résultat JSON gzip, features numpy float16,
+sauf l'enveloppe RMS gardée en float32 pour redétecter les drops à l'identique).
+"""
+import gzip
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+import numpy as np
+
+from app.services.response_encoder import json_default
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    analysis_version TEXT NOT NULL,
+    duration REAL NOT NULL,
+    tempo REAL NOT NULL,
+    n_sections INTEGER NOT NULL,
+    n_drops INTEGER NOT NULL,
+    drop_times TEXT NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 0,  -- Génération de la dernière écriture du morceau (ETag)
+    thresholds TEXT                       -- Seuils de classification appliqués (JSON)
+);
+CREATE INDEX IF NOT EXISTS idx_tracks_tempo ON tracks (tempo);
+CREATE INDEX IF NOT EXISTS idx_tracks_drops_tempo ON tracks (n_drops, tempo);
+
+CREATE TABLE IF NOT EXISTS sections (
+    track_id TEXT NOT NULL REFERENCES tracks (id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    type TEXT NOT NULL,
+    energy REAL NOT NULL,
+    energy_variation REAL NOT NULL,
+    brightness REAL NOT NULL,
+    brightness_variation REAL NOT NULL,
+    bandwidth REAL NOT NULL,
+    percussiveness REAL NOT NULL,
+    PRIMARY KEY (track_id, idx)
+);
+
+CREATE TABLE IF NOT EXISTS section_counts (
+    track_id TEXT NOT NULL REFERENCES tracks (id) ON DELETE CASCADE,
+    section_type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (track_id, section_type)
+);
+CREATE INDEX IF NOT EXISTS idx_section_counts_type ON section_counts (section_type, count, track_id);
+
+CREATE TABLE IF NOT EXISTS track_vectors (
+    track_id TEXT PRIMARY KEY REFERENCES tracks (id) ON DELETE CASCADE,
+    vector BLOB NOT NULL,
+    generation INTEGER NOT NULL DEFAULT 0
+);
+
+-- Compteur de modifications (une ligne), incrémenté à chaque écriture
+-- et seuils de classification actifs (JSON, NULL: seuils par défaut)
+CREATE TABLE IF NOT EXISTS library_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    generation INTEGER NOT NULL,
+    thresholds TEXT
+);
+INSERT OR IGNORE INTO library_state (id, generation) VALUES (1, 0);
+"""
+
+# Features conservées pour les traitements hors ligne (similarité, reclassification)
+STORED_FEATURES = ('rms', 'spectral_centroid', 'spectral_bandwidth', 'zero_crossing_rate', 'mfcc', 'chroma')
+# Features stockées sans perte: find_peaks sur du float16 crée égalités et plateaux
+EXACT_FEATURES = ('rms',)
+
+
+class AnalysisLibrary:
+    """Bibliothèque locale des analyses, interrogeable par tempo et composition."""
+
+    def __init__(self, folder):
+        """
+        Args:
+            folder: Dossier racine (library.db, results/, features/)
+        """
+        self.folder = folder
+        self.db_path = os.path.join(folder, 'library.db')
+        self.results_folder = os.path.join(folder, 'results')
+        self.features_folder = os.path.join(folder, 'features')
+
+        os.makedirs(self.results_folder, exist_ok=True)
+        os.makedirs(self.features_folder, exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(SCHEMA)
+            self._migrate(connection)
+
+    def save(self, track_id, filename, features, sections, drops, result, analysis_version,
+             summary_vector=None, thresholds=None):
+        """
+        Enregistre (ou remplace) l'analyse d'un morceau.
+
+        Args:
+            track_id: Identifiant du morceau (empreinte du fichier)
+            filename: Nom du fichier d'origine
+            features: Features audio (de MusicAnalyzer)
+            sections: Sections (de SectionDetector)
+            drops: Temps des drops (secondes)
+            result: Réponse complète de l'analyse (timeline, keyframes...)
+            analysis_version: Version du format d'analyse
+            summary_vector: Vecteur résumé de longueur fixe (index de similarité)
+            thresholds: Seuils de classification utilisés par SectionDetector
+        """
+        self._write_result(track_id, result)
+
+        np.savez_compressed(
+            self._features_path(track_id),
+            sr=features['sr'],
+            hop_length=features['hop_length'],
+            tempo=features['tempo'],
+            **{
+                name: np.asarray(features[name], dtype=np.float32 if name in EXACT_FEATURES else np.float16)
+                for name in STORED_FEATURES
+            }
+        )
+
+        counts = {}
+        for section in sections:
+            counts[section['type']] = counts.get(section['type'], 0) + 1
+
+        with self._connect() as connection:
+            generation = self._bump_generation(connection)
+            connection.execute('DELETE FROM tracks WHERE id = ?', (track_id,))
+            connection.execute(
+                'INSERT INTO tracks (id, filename, created_at, analysis_version, duration, tempo, '
+                'n_sections, n_drops, drop_times, revision, thresholds) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (track_id, filename, time.time(), analysis_version, float(features['duration']),
+                 float(features['tempo']), len(sections), len(drops), json.dumps(list(drops)), generation,
+                 json.dumps(thresholds) if thresholds is not None else None)
+            )
+            connection.executemany(
+                'INSERT INTO sections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(track_id, s['index'], s['start'], s['end'], s['type'], s['energy'],
+                  s['energy_variation'], s['brightness'], s['brightness_variation'],
+                  s['bandwidth'], s['percussiveness']) for s in sections]
+            )
+            connection.executemany(
+                'INSERT INTO section_counts VALUES (?, ?, ?)',
+                [(track_id, section_type, count) for section_type, count in counts.items()]
+            )
+            if summary_vector is not None:
+                connection.execute(
+                    'INSERT INTO track_vectors VALUES (?, ?, ?)',
+                    (track_id, np.asarray(summary_vector, dtype=np.float32).tobytes(), generation)
+                )
+
+        print(f"📚 Analyse enregistrée dans la bibliothèque: {track_id} ({filename})")
+
+    def get(self, track_id):
+        """Résultat complet d'une analyse, ou None si absente."""
+        path = self._result_path(track_id)
+        if not self._valid_id(track_id) or not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get_summary(self, track_id):
+        """Métadonnées indexées d'un morceau, ou None."""
+        with self._connect() as connection:
+            row = connection.execute('SELECT * FROM tracks WHERE id = ?', (track_id,)).fetchone()
+            if row is None:
+                return None
+            return self._summarize(connection, [row])[0]
+
+    def load_features(self, track_id):
+        """Features stockées (float16, RMS en float32) d'un morceau, ou None."""
+        path = self._features_path(track_id)
+        if not self._valid_id(track_id) or not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    def load_envelope(self, track_id):
+        """
+        Enveloppe RMS stockée d'un morceau, sans décompresser les autres features.
+
+        Returns:
+            dict: rms, sr, hop_length, ou None si absente
+        """
+        path = self._features_path(track_id)
+        if not self._valid_id(track_id) or not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return {'rms': data['rms'], 'sr': int(data['sr']), 'hop_length': int(data['hop_length'])}
+
+    def get_thresholds(self):
+        """Seuils de classification actifs (surcharges des seuils par défaut, {} si aucune)."""
+        with self._connect() as connection:
+            row = connection.execute('SELECT thresholds FROM library_state WHERE id = 1').fetchone()
+        return json.loads(row['thresholds']) if row['thresholds'] else {}
+
+    def load_vectors(self, since_generation=None):
+        """
+        Charge les vecteurs résumés, tous ou seulement ceux écrits après une génération.
+
+        Args:
+            since_generation: Génération déjà connue (None: tout charger)
+
+        Returns:
+            tuple: (liste des track_id, matrice float32 (n, dim))
+        """
+        with self._connect() as connection:
+            if since_generation is None:
+                rows = connection.execute('SELECT track_id, vector FROM track_vectors ORDER BY track_id').fetchall()
+            else:
+                rows = connection.execute(
+                    'SELECT track_id, vector FROM track_vectors WHERE generation > ? ORDER BY generation',
+                    (since_generation,)
+                ).fetchall()
+        if not rows:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        ids = [row['track_id'] for row in rows]
+        matrix = np.stack([np.frombuffer(row['vector'], dtype=np.float32) for row in rows])
+        return ids, matrix
+
+    def get_version(self):
+        """Génération courante: incrémentée à chaque écriture (lecture d'une seule ligne)."""
+        with self._connect() as connection:
+            return connection.execute('SELECT generation FROM library_state WHERE id = 1').fetchone()[0]
+
+    def get_summaries(self, track_ids):
+        """Métadonnées de plusieurs morceaux, dans l'ordre demandé."""
+        if not track_ids:
+            return []
+        placeholders = ','.join('?' * len(track_ids))
+        with self._connect() as connection:
+            rows = connection.execute(
+                f'SELECT * FROM tracks WHERE id IN ({placeholders})', list(track_ids)
+            ).fetchall()
+            summaries = {summary['id']: summary for summary in self._summarize(connection, rows)}
+        return [summaries[track_id] for track_id in track_ids if track_id in summaries]
+
+    def load_section_table(self):
+        """
+        Statistiques de toutes les sections, en colonnes numpy.
+
+        Returns:
+            dict: track, index, energy, energy_variation, brightness, type
+                  (triées par morceau puis par position)
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                'SELECT track_id, idx, energy, energy_variation, brightness, type '
+                'FROM sections ORDER BY track_id, idx'
+            ).fetchall()
+
+        columns = list(zip(*rows)) if rows else [()] * 6
+        return {
+            'track': np.array(columns[0], dtype=object),
+            'index': np.array(columns[1], dtype=np.int64),
+            'energy': np.array(columns[2], dtype=np.float64),
+            'energy_variation': np.array(columns[3], dtype=np.float64),
+            'brightness': np.array(columns[4], dtype=np.float64),
+            'type': np.array(columns[5], dtype=object),
+        }
+
+    def update_classifications(self, table, types, drops=None, rebuild_result=None, thresholds=None):
+        """
+        Enregistre de nouveaux types de sections (et éventuellement de drops).
+
+        Les tables indexées et le résultat JSON complet des morceaux concernés
+        sont mis à jour ensemble; leur révision prend la génération courante (ETag).
+        Les résultats sont écrits dans des fichiers temporaires pendant la
+        transaction et ne remplacent les anciens qu'après le commit: en cas
+        d'erreur, ni la base ni les fichiers ne changent.
+
+        Args:
+            table: Table de sections (de load_section_table)
+            types: Nouveaux types, alignés sur la table
+            drops: {track_id: temps des drops} optionnel
+            rebuild_result: Fonction (track_id, résultat) -> résultat appelée après
+                            mise à jour des sections, pour régénérer les parties
+                            dérivées (timeline, keyframes)
+            thresholds: Seuils appliqués, enregistrés comme seuils actifs de la
+                        bibliothèque (nouvelles analyses) et pour chaque morceau
+
+        Returns:
+            int: Nombre de morceaux modifiés
+        """
+        types = np.asarray(types, dtype=object)
+        changed = np.flatnonzero(types != table['type'])
+        changed_tracks = set(table['track'][changed])
+
+        counts = {}
+        new_types = {}
+        mask = np.isin(table['track'], sorted(changed_tracks))
+        for track_id, index, section_type in zip(table['track'][mask], table['index'][mask], types[mask]):
+            track_counts = counts.setdefault(track_id, {})
+            track_counts[section_type] = track_counts.get(section_type, 0) + 1
+            new_types.setdefault(track_id, {})[int(index)] = section_type
+
+        pending = []
+        try:
+            with self._connect() as connection:
+                if thresholds is not None:
+                    connection.execute('UPDATE library_state SET thresholds = ? WHERE id = 1', (json.dumps(thresholds),))
+                    connection.execute('UPDATE tracks SET thresholds = ?', (json.dumps(thresholds),))
+
+                # Drops: ne réécrire que les morceaux dont les drops changent
+                drop_changes = {}
+                if drops:
+                    stored = dict(connection.execute('SELECT id, drop_times FROM tracks').fetchall())
+                    for track_id, times in drops.items():
+                        times = [float(x) for x in times]
+                        if track_id in stored and np.round(times, 3).tolist() != np.round(json.loads(stored[track_id]), 3).tolist():
+                            drop_changes[track_id] = times
+
+                affected = sorted(changed_tracks | set(drop_changes))
+                if not affected:
+                    return 0
+
+                generation = self._bump_generation(connection)
+                connection.executemany(
+                    'UPDATE sections SET type = ? WHERE track_id = ? AND idx = ?',
+                    [(types[i], table['track'][i], int(table['index'][i])) for i in changed]
+                )
+                connection.executemany(
+                    'DELETE FROM section_counts WHERE track_id = ?',
+                    [(track_id,) for track_id in changed_tracks]
+                )
+                connection.executemany(
+                    'INSERT INTO section_counts VALUES (?, ?, ?)',
+                    [(track_id, section_type, count)
+                     for track_id, track_counts in counts.items()
+                     for section_type, count in track_counts.items()]
+                )
+                connection.executemany(
+                    'UPDATE tracks SET n_drops = ?, drop_times = ? WHERE id = ?',
+                    [(len(times), json.dumps(times), track_id) for track_id, times in drop_changes.items()]
+                )
+                connection.executemany(
+                    'UPDATE tracks SET revision = ? WHERE id = ?',
+                    [(generation, track_id) for track_id in affected]
+                )
+
+                # Résultats complets préparés dans des fichiers temporaires
+                for track_id in affected:
+                    result = self.get(track_id)
+                    if result is None:
+                        continue
+                    for section in result.get('sections', []):
+                        section['type'] = new_types.get(track_id, {}).get(section['index'], section['type'])
+                    if track_id in drop_changes:
+                        result['drops'] = drop_changes[track_id]
+                    if 'stats' in result:
+                        section_types = {}
+                        for section in result.get('sections', []):
+                            section_types[section['type']] = section_types.get(section['type'], 0) + 1
+                        result['stats']['section_types'] = section_types
+                    if rebuild_result is not None:
+                        result = rebuild_result(track_id, result)
+                    pending.append((self._write_temp_result(track_id, result), self._result_path(track_id)))
+        except Exception:
+            for temp_path, _ in pending:
+                os.remove(temp_path)
+            raise
+
+        # Transaction validée: les nouveaux résultats remplacent les anciens
+        for temp_path, path in pending:
+            os.replace(temp_path, path)
+
+        print(f"📚 Reclassification enregistrée: {len(affected)} morceaux modifiés")
+        return len(affected)
+
+    def search(self, tempo_min=None, tempo_max=None, min_drops=None, section_counts=None,
+               limit=50, offset=0):
+        """
+        Recherche des morceaux par tempo, nombre de drops et composition.
+
+        Args:
+            tempo_min, tempo_max: Bornes de tempo (BPM, incluses)
+            min_drops: Nombre minimum de drops détectés
+            section_counts: {type: minimum}, ex. {'drop': 2, 'chorus': 1}
+            limit, offset: Pagination
+
+        Returns:
+            list: Résumés des morceaux (triés par tempo)
+        """
+        clauses, params = [], []
+        if tempo_min is not None:
+            clauses.append('t.tempo >= ?')
+            params.append(tempo_min)
+        if tempo_max is not None:
+            clauses.append('t.tempo <= ?')
+            params.append(tempo_max)
+        if min_drops is not None:
+            clauses.append('t.n_drops >= ?')
+            params.append(min_drops)
+        for section_type, minimum in (section_counts or {}).items():
+            clauses.append(
+                'EXISTS (SELECT 1 FROM section_counts c '
+                'WHERE c.track_id = t.id AND c.section_type = ? AND c.count >= ?)'
+            )
+            params.extend([section_type, minimum])
+
+        query = 'SELECT t.* FROM tracks t'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY t.tempo LIMIT ? OFFSET ?'
+        params.extend([limit, offset])
+
+        with self._connect() as connection:
+            rows = connection.execute(query, params).fetchall()
+            return self._summarize(connection, rows)
+
+    def _summarize(self, connection, rows):
+        """Ajoute la composition en sections aux lignes de `tracks`."""
+        if not rows:
+            return []
+
+        ids = [row['id'] for row in rows]
+        placeholders = ','.join('?' * len(ids))
+        counts = {}
+        for track_id, section_type, count in connection.execute(
+            f'SELECT track_id, section_type, count FROM section_counts WHERE track_id IN ({placeholders})',
+            ids
+        ):
+            counts.setdefault(track_id, {})[section_type] = count
+
+        return [{
+            'id': row['id'],
+            'filename': row['filename'],
+            'created_at': row['created_at'],
+            'analysis_version': row['analysis_version'],
+            'duration': row['duration'],
+            'tempo': row['tempo'],
+            'n_sections': row['n_sections'],
+            'n_drops': row['n_drops'],
+            'drop_times': json.loads(row['drop_times']),
+            'revision': row['revision'],
+            'section_types': counts.get(row['id'], {}),
+        } for row in rows]
+
+    @staticmethod
+    def _bump_generation(connection):
+        """Incrémente la génération dans la transaction courante et la renvoie."""
+        connection.execute('UPDATE library_state SET generation = generation + 1 WHERE id = 1')
+        return connection.execute('SELECT generation FROM library_state WHERE id = 1').fetchone()[0]
+
+    @staticmethod
+    def _migrate(connection):
+        """Complète une base créée par une version précédente du schéma."""
+        columns = {row['name'] for row in connection.execute('PRAGMA table_info(tracks)')}
+        if 'revision' not in columns:
+            connection.execute('ALTER TABLE tracks ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+        if 'thresholds' not in columns:
+            connection.execute('ALTER TABLE tracks ADD COLUMN thresholds TEXT')
+
+        columns = {row['name'] for row in connection.execute('PRAGMA table_info(library_state)')}
+        if 'thresholds' not in columns:
+            connection.execute('ALTER TABLE library_state ADD COLUMN thresholds TEXT')
+
+        columns = {row['name'] for row in connection.execute('PRAGMA table_info(track_vectors)')}
+        if 'generation' not in columns:
+            connection.execute('ALTER TABLE track_vectors ADD COLUMN generation INTEGER NOT NULL DEFAULT 0')
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS idx_track_vectors_generation ON track_vectors (generation)'
+        )
+
+    def _write_result(self, track_id, result):
+        """Écrit le résultat JSON gzip (fichier temporaire puis remplacement atomique)."""
+        os.replace(self._write_temp_result(track_id, result), self._result_path(track_id))
+
+    def _write_temp_result(self, track_id, result):
+        """Écrit le résultat JSON gzip dans un fichier temporaire et renvoie son chemin."""
+        temp_path = f"{self._result_path(track_id)}.{uuid.uuid4().hex}.tmp"
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            json.dump(result, f, default=json_default, separators=(',', ':'))
+        return temp_path
+
+    def _connect(self):
+        """Connexion SQLite (une par opération, partageable entre workers via WAL)."""
+        connection = sqlite3.connect(self.db_path, timeout=10)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA foreign_keys = ON')
+        return _ClosingConnection(connection)
+
+    @staticmethod
+    def _valid_id(track_id):
+        return track_id.isalnum()
+
+    def _result_path(self, track_id):
+        return os.path.join(self.results_folder, f"{track_id}.json.gz")
+
+    def _features_path(self, track_id):
+        return os.path.join(self.features_folder, f"{track_id}.npz")
+
+
+class _ClosingConnection:
+    """Context manager: commit/rollback puis fermeture de la connexion."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.connection.commit()
+            else:
+                self.connection.rollback()
+        finally:
+            self.connection.close()
+        return False
@@ -0,0 +1,145 @@
+"""
+Service de reclassification par lots.
+Applique la classification des sections et l'affinage par contexte de
+SectionDetector à de nombreux morceaux à la fois, sous forme d'opérations
+numpy sur une table de statistiques de sections, ainsi que la détection
+des drops sur les enveloppes stockées.
+"""
+import numpy as np
+
+from app.services.section_detector import CLASSIFICATION_THRESHOLDS, find_drop_peaks
+
+
+class BatchClassifier:
+    """
+    Moteur de classification vectorisé, équivalent à SectionDetector.
+
+    La table de sections est un dictionnaire de colonnes numpy de même
+    longueur, triées par morceau puis par position dans le morceau:
+    track (identifiant), index (indice de frontière), energy,
+    energy_variation, brightness.
+    """
+
+    def __init__(self, thresholds=None):
+        """
+        Args:
+            thresholds: Seuils (surcharge de CLASSIFICATION_THRESHOLDS)
+        """
+        self.thresholds = {**CLASSIFICATION_THRESHOLDS, **(thresholds or {})}
+
+    def classify(self, table):
+        """
+        Classifie toutes les sections de la table (cf. SectionDetector._classify_section).
+
+        La position relative utilise index / (index max + 1) du morceau: identique
+        au calcul d'origine sauf si la dernière section avait été écartée.
+
+        Returns:
+            numpy.ndarray: Types de sections (dtype objet)
+        """
+        t = self.thresholds
+        energy = np.asarray(table['energy'])
+        brightness = np.asarray(table['brightness'])
+        energy_var = np.asarray(table['energy_variation'])
+        index = np.asarray(table['index'])
+        if len(index) == 0:
+            return np.zeros(0, dtype=object)
+
+        starts, track_rows = self._track_layout(table['track'])
+        total = np.maximum.reduceat(index, starts)[track_rows] + 1
+        position = index / total
+
+        loud = (energy > t['loud_energy']) & (brightness > t['loud_brightness'])
+        variable = energy_var > t['variation']
+        end_zone = position > t['outro_min_position']
+
+        # Même ordre de priorité que les if/elif de _classify_section
+        return np.select(
+            [
+                (position < t['intro_max_position']) & (energy < t['low_energy']),
+                end_zone & (energy < t['low_energy']),
+                end_zone & (energy > t['final_chorus_energy']),
+                loud & (energy > t['drop_energy']),
+                loud,
+                (energy > t['chorus_energy']) & (brightness > t['chorus_brightness']),
+                variable & (energy > t['buildup_energy']),
+                variable,
+                (energy > t['verse_min_energy']) & (energy < t['verse_max_energy']),
+                energy < t['bridge_max_energy'],
+            ],
+            ['intro', 'outro', 'final_chorus', 'drop', 'chorus', 'chorus',
+             'buildup', 'breakdown', 'verse', 'bridge'],
+            default='interlude'
+        ).astype(object)
+
+    def refine(self, table, types):
+        """
+        Affinage par contexte (cf. SectionDetector._refine_classifications).
+
+        Les règles ne modifient que des sections 'interlude' ou 'buildup' et ne
+        lisent le type précédent que pour le comparer à 'chorus': les appliquer
+        sur les types d'origine décalés donne le même résultat que la boucle.
+
+        Returns:
+            numpy.ndarray: Types affinés
+        """
+        types = np.asarray(types, dtype=object)
+        n = len(types)
+        if n < 3:
+            return types.copy()
+
+        starts, track_rows = self._track_layout(table['track'])
+        rows = np.arange(n)
+        first = rows == starts[track_rows]
+        ends = np.append(starts[1:], n) - 1
+        last = rows == ends[track_rows]
+        interior = ~first & ~last
+
+        prev_types = np.roll(types, 1)
+        next_types = np.roll(types, -1)
+
+        refined = types.copy()
+        refined[interior & (types == 'interlude') & (prev_types == 'chorus') & (next_types == 'chorus')] = 'bridge'
+        refined[interior & (types == 'buildup') & np.isin(next_types, ['chorus', 'drop'])] = 'pre_drop'
+        return refined
+
+    def classify_and_refine(self, table):
+        """Classification complète (classify puis refine)."""
+        return self.refine(table, self.classify(table))
+
+    def detect_drops(self, rms_list, sr_list, hop_list):
+        """
+        Détection des drops sur plusieurs morceaux (cf. SectionDetector.detect_drops).
+
+        Chaque enveloppe passe par find_drop_peaks, comme en analyse: un appel
+        scipy (code C) par morceau, identique au résultat d'origine tant que
+        l'enveloppe est celle de l'analyse (RMS float32 stocké sans perte).
+
+        Args:
+            rms_list: Enveloppes RMS, une par morceau
+            sr_list, hop_list: Sample rate et hop de chaque morceau
+
+        Returns:
+            list: Temps des drops (numpy.ndarray, secondes) par morceau
+        """
+        return [
+            find_drop_peaks(rms, sr, hop, self.thresholds) * hop / sr
+            for rms, sr, hop in zip(rms_list, sr_list, hop_list)
+        ]
+
+    @staticmethod
+    def _track_layout(tracks):
+        """
+        Début de chaque morceau dans la table et morceau de chaque ligne.
+
+        Returns:
+            tuple: (indices de début, numéro de morceau par ligne)
+        """
+        tracks = np.asarray(tracks)
+        if len(tracks) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        boundaries = np.flatnonzero(tracks[1:] != tracks[:-1]) + 1
+        starts = np.concatenate([[0], boundaries])
+        track_rows = np.zeros(len(tracks), dtype=int)
+        track_rows[boundaries] = 1
+        return starts, np.cumsum(track_rows)
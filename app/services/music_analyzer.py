@@ -10,16 +10,18 @@ from scipy import signal
 class MusicAnalyzer:
     """Analyse les caractéristiques audio d'un fichier musical."""
     
-    def __init__(self, sr=22050, fast_mode=True):
+    def __init__(self, sr=22050, fast_mode=True, stereo=False):
         """
         Args:
             sr: Sample rate pour le chargement audio (22050 pour Railway - plus de RAM!)
             fast_mode: Si True, réduit la qualité pour accélérer l'analyse
+            stereo: Si True, conserve les deux canaux et extrait les features stéréo
         """
         self.sr = sr
         self.hop_length = 1024 if fast_mode else 512  # Doubler le hop pour 2x plus rapide
         self.n_fft = 2048
         self.fast_mode = fast_mode
+        self.stereo = stereo
     
     def analyze(self, audio_path):
         """
@@ -33,15 +35,62 @@ class MusicAnalyzer:
         """
         print(f"Chargement de {audio_path}...")
         
-        # Charger l'audio
-        y, sr = librosa.load(audio_path, sr=self.sr)
+        # Charger l'audio (un seul décodage, canaux conservés en mode stéréo)
+        y, sr = librosa.load(audio_path, sr=self.sr, mono=not self.stereo)
+        
+        return self.analyze_signal(y, sr)
+    
+    def analyze_signal(self, y, sr):
+        """
+        Analyse un signal audio déjà décodé.
+        
+        En mode stéréo, les deux canaux sont transformés par une seule STFT
+        batchée; le mid (moyenne des canaux) est exactement la STFT du signal
+        mono, donc les features mono en sont dérivées sans calcul supplémentaire.
+        
+        Args:
+            y: Signal audio (numpy array, mono (n,) ou multicanal (c, n); seul
+               c = 2 donne une analyse stéréo, les autres cas sont downmixés)
+            sr: Sample rate du signal
+            
+        Returns:
+            dict: Dictionnaire contenant toutes les features extraites
+        """
+        y_channels = y if y.ndim == 2 else None
+        if y_channels is not None:
+            y = np.mean(y_channels, axis=0)
+            # Multicanal (5.1...): pas de paire gauche/droite, analyse mono du
+            # downmix pour que toutes les features décrivent le même signal
+            if y_channels.shape[0] != 2:
+                print(f"⚠️ {y_channels.shape[0]} canaux: downmix mono, pas d'analyse stéréo")
+                y_channels = None
         duration = len(y) / sr
         
         print("Durée: {:.2f}s, Sample rate: {}Hz".format(duration, sr))
         print("Extraction des features...")
         
-        # 1. Tempo et beats
-        tempo, beats = librosa.beat.beat_track(y=y, sr=sr, hop_length=self.hop_length)
+        # STFT unique partagée par toutes les features spectrales
+        stft_kwargs = {'n_fft': self.n_fft, 'hop_length': self.hop_length}
+        if y_channels is not None:
+            D = librosa.stft(y_channels, **stft_kwargs)  # (2, freq, frames)
+            magnitude = np.abs((D[0] + D[1]) / 2)
+            side_power = np.abs((D[0] - D[1]) / 2) ** 2
+            del D
+        else:
+            magnitude = np.abs(librosa.stft(y, **stft_kwargs))
+            side_power = None
+        power = magnitude ** 2
+        
+        # Mel log commun au MFCC et aux enveloppes d'onset
+        mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=sr))
+        
+        # 1. Tempo et beats (enveloppe médiane, comme beat_track par défaut)
+        beat_onset_env = librosa.onset.onset_strength(
+            S=mel_db, sr=sr, hop_length=self.hop_length, aggregate=np.median
+        )
+        tempo, beats = librosa.beat.beat_track(
+            onset_envelope=beat_onset_env, sr=sr, hop_length=self.hop_length
+        )
         beat_times = librosa.frames_to_time(beats, sr=sr, hop_length=self.hop_length)
         
         print("Tempo détecté: {:.1f} BPM, {} beats".format(float(tempo), len(beats)))
@@ -51,15 +100,15 @@ class MusicAnalyzer:
         
         # 3. Spectral features
         spectral_centroid = librosa.feature.spectral_centroid(
-            y=y, sr=sr, hop_length=self.hop_length
+            S=magnitude, sr=sr, hop_length=self.hop_length
         )[0]
         
         spectral_rolloff = librosa.feature.spectral_rolloff(
-            y=y, sr=sr, hop_length=self.hop_length
+            S=magnitude, sr=sr, hop_length=self.hop_length
         )[0]
         
         spectral_bandwidth = librosa.feature.spectral_bandwidth(
-            y=y, sr=sr, hop_length=self.hop_length
+            S=magnitude, sr=sr, hop_length=self.hop_length
         )[0]
         
         # 4. Zero crossing rate (utile pour détecter les sections percussives)
@@ -67,18 +116,16 @@ class MusicAnalyzer:
         
         # 5. MFCC pour la structure (coefficients cepstraux)
         n_mfcc = 13 if self.fast_mode else 20
-        mfcc = librosa.feature.mfcc(
-            y=y, sr=sr, n_mfcc=n_mfcc, hop_length=self.hop_length
-        )
+        mfcc = librosa.feature.mfcc(S=mel_db, sr=sr, n_mfcc=n_mfcc)
         
         # 6. Chroma features (contenu harmonique)
         chroma = librosa.feature.chroma_stft(
-            y=y, sr=sr, hop_length=self.hop_length
+            S=power, sr=sr, hop_length=self.hop_length
         )
         
         # 7. Onset strength (force des attaques)
         onset_env = librosa.onset.onset_strength(
-            y=y, sr=sr, hop_length=self.hop_length
+            S=mel_db, sr=sr, hop_length=self.hop_length
         )
         
         # 8. Tempogram (variations de tempo)
@@ -86,10 +133,8 @@ class MusicAnalyzer:
             onset_envelope=onset_env, sr=sr, hop_length=self.hop_length
         )
         
-        print("Features extraites avec succès!")
-        
-        return {
-            'y': y,  # Signal audio
+        features = {
+            'y': y,  # Signal audio (mono)
             'sr': sr,
             'duration': duration,
             'tempo': float(tempo),
@@ -106,6 +151,64 @@ class MusicAnalyzer:
             'tempogram': tempogram,
             'hop_length': self.hop_length
         }
+        
+        # 9. Features stéréo (mêmes frames que les features mono)
+        if self.stereo:
+            features['stereo'] = self._extract_stereo_features(
+                y_channels, power, side_power, sr
+            )
+        
+        print("Features extraites avec succès!")
+        
+        return features
+    
+    def _extract_stereo_features(self, y_channels, mid_power, side_power, sr):
+        """
+        Enveloppes stéréo: énergie gauche/droite et mid/side, largeur stéréo
+        globale et par bande (graves < 250Hz, médiums, aigus > 4kHz).
+        
+        Un fichier mono donne des enveloppes gauche = droite et une largeur nulle.
+        """
+        n_frames = mid_power.shape[1]
+        
+        if y_channels is None:
+            mono_rms = librosa.feature.rms(S=np.sqrt(mid_power), frame_length=self.n_fft)[0]
+            zeros = np.zeros(n_frames, dtype=np.float32)
+            return {
+                'is_stereo': False,
+                'left_energy': mono_rms, 'right_energy': mono_rms,
+                'mid_energy': mono_rms, 'side_energy': zeros,
+                'balance': zeros, 'width': zeros,
+                'width_bands': {'low': zeros, 'mid': zeros, 'high': zeros}
+            }
+        
+        # Énergie par canal, batchée sur les deux canaux
+        channel_rms = librosa.feature.rms(y=y_channels, hop_length=self.hop_length)[..., 0, :]
+        left, right = channel_rms[0], channel_rms[1]
+        
+        # Mid/side dans le domaine spectral (même STFT que les features mono)
+        frame_length = self.n_fft
+        mid_rms = librosa.feature.rms(S=np.sqrt(mid_power), frame_length=frame_length)[0]
+        side_rms = librosa.feature.rms(S=np.sqrt(side_power), frame_length=frame_length)[0]
+        
+        eps = 1e-10
+        total_power = mid_power + side_power + eps
+        freqs = librosa.fft_frequencies(sr=sr, n_fft=self.n_fft)
+        bands = {'low': freqs < 250, 'mid': (freqs >= 250) & (freqs < 4000), 'high': freqs >= 4000}
+        
+        return {
+            'is_stereo': True,
+            'left_energy': left,
+            'right_energy': right,
+            'mid_energy': mid_rms,
+            'side_energy': side_rms,
+            'balance': (right - left) / (right + left + eps),
+            'width': np.sum(side_power, axis=0) / np.sum(total_power, axis=0),
+            'width_bands': {
+                name: np.sum(side_power[mask], axis=0) / np.sum(total_power[mask], axis=0)
+                for name, mask in bands.items()
+            }
+        }
     
     def get_frame_time(self, frame_idx):
         """Convertit un index de frame en temps (secondes)."""
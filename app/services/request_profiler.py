@@ -0,0 +1,129 @@
+"""
+Service de profilage à la demande des analyses.
+Exécute une requête sous cProfile et stocke le profil avec ses métadonnées.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{10}_[0-9a-f]{8}$')
+
+
+class ProfileStore:
+    """Enregistre et relit les profils d'analyse dans un dossier local."""
+
+    def __init__(self, folder, max_profiles=50):
+        """
+        Args:
+            folder: Dossier de stockage des profils (.prof + .json)
+            max_profiles: Nombre de profils conservés (les plus anciens sont supprimés)
+        """
+        self.folder = folder
+        self.max_profiles = max_profiles
+        # Un seul profil à la fois: depuis Python 3.12, cProfile s'appuie sur
+        # sys.monitoring, partagé par tout l'interpréteur
+        self._active = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    @contextmanager
+    def session(self, filename):
+        """
+        Profile le bloc englobé puis sauvegarde le résultat.
+
+        Le dictionnaire renvoyé peut être complété par l'appelant (durée,
+        format...) : il est enregistré comme métadonnées du profil.
+
+        Args:
+            filename: Nom du fichier analysé
+        """
+        profile_id = f"{int(time.time())}_{uuid.uuid4().hex[:8]}"
+        info = {
+            'id': profile_id,
+            'filename': filename,
+            'format': filename.rsplit('.', 1)[-1].lower() if '.' in filename else None,
+            'created_at': time.time(),
+        }
+
+        if not self._active.acquire(blocking=False):
+            print("⚠️ Profilage déjà en cours, requête exécutée sans profil")
+            info['id'] = None
+            yield info
+            return
+
+        profiler = cProfile.Profile()
+        start = time.time()
+        profiler.enable()
+        try:
+            yield info
+        finally:
+            profiler.disable()
+            self._active.release()
+            info['elapsed'] = time.time() - start
+            self._save(profiler, info)
+
+    def list_profiles(self):
+        """Liste les métadonnées des profils stockés (plus récents en premier)."""
+        profiles = []
+        for name in sorted(os.listdir(self.folder), reverse=True):
+            if name.endswith('.json'):
+                with open(os.path.join(self.folder, name)) as f:
+                    profiles.append(json.load(f))
+        return profiles
+
+    def get_metadata(self, profile_id):
+        """Métadonnées d'un profil, ou None s'il n'existe pas."""
+        path = self._path(profile_id, 'json')
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def get_raw_path(self, profile_id):
+        """Chemin du fichier .prof (format pstats), ou None."""
+        path = self._path(profile_id, 'prof')
+        if path is None or not os.path.exists(path):
+            return None
+        return path
+
+    def get_report(self, profile_id, sort_by='cumulative', limit=40):
+        """Rapport texte pstats du profil, ou None s'il n'existe pas."""
+        path = self.get_raw_path(profile_id)
+        if path is None:
+            return None
+
+        output = io.StringIO()
+        stats = pstats.Stats(path, stream=output)
+        stats.strip_dirs().sort_stats(sort_by).print_stats(limit)
+        return output.getvalue()
+
+    def _path(self, profile_id, extension):
+        """Chemin d'un fichier de profil (None si l'identifiant est invalide)."""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        return os.path.join(self.folder, f"{profile_id}.{extension}")
+
+    def _save(self, profiler, info):
+        """Écrit le profil et ses métadonnées, puis purge les plus anciens."""
+        try:
+            profiler.dump_stats(self._path(info['id'], 'prof'))
+            with open(self._path(info['id'], 'json'), 'w') as f:
+                json.dump(info, f)
+            print(f"📈 Profil enregistré: {info['id']} ({info['elapsed']:.2f}s)")
+        except Exception as e:
+            print(f"⚠️ Impossible d'enregistrer le profil {info['id']}: {e}")
+            return
+
+        metadata_files = sorted(name for name in os.listdir(self.folder) if name.endswith('.json'))
+        for name in metadata_files[:-self.max_profiles]:
+            for extension in ('json', 'prof'):
+                path = os.path.join(self.folder, f"{name[:-5]}.{extension}")
+                if os.path.exists(path):
+                    os.remove(path)
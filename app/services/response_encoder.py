@@ -0,0 +1,118 @@
+"""
+Service d'encodage des réponses de l'API.
+Sérialisation JSON rapide (numpy natif), représentation compacte des beats
+et compression négociée (brotli/gzip).
+"""
+import gzip
+import json
+
+import numpy as np
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Fallback sur le module json standard
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Pas de brotli: gzip uniquement
+    brotli = None
+
+
+# Taille minimale (octets) en dessous de laquelle on ne compresse pas
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_MIMETYPES = {'application/json'}
+
+
+def json_default(obj):
+    """Convertit les types numpy non gérés nativement."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Type non sérialisable: {type(obj).__name__}")
+
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    """Provider JSON Flask basé sur orjson (si disponible), compatible numpy."""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None:
+            return orjson.dumps(
+                obj,
+                default=json_default,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            ).decode('utf-8')
+        kwargs.setdefault('default', json_default)
+        kwargs.setdefault('ensure_ascii', False)
+        kwargs.setdefault('separators', (',', ':'))
+        return json.dumps(obj, **kwargs)
+
+
+def compact_beat_times(beat_times, resolution=0.001):
+    """
+    Encode une liste de temps de beats en deltas entiers quantifiés.
+
+    Args:
+        beat_times: Temps des beats (secondes)
+        resolution: Pas de quantification (secondes), 1ms par défaut
+
+    Returns:
+        dict: {encoding, resolution, deltas} — décodage:
+              t[i] = somme(deltas[:i+1]) * resolution
+    """
+    ticks = np.round(np.asarray(beat_times, dtype=np.float64) / resolution).astype(np.int64)
+    return {
+        'encoding': 'delta',
+        'resolution': resolution,
+        'deltas': np.diff(ticks, prepend=0).tolist(),
+    }
+
+
+def quantize_floats(obj, decimals=3):
+    """Arrondit récursivement les floats (sections, timeline) pour alléger le JSON."""
+    if isinstance(obj, (float, np.floating)):
+        return round(float(obj), decimals)
+    if isinstance(obj, dict):
+        return {key: quantize_floats(value, decimals) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [quantize_floats(value, decimals) for value in obj]
+    return obj
+
+
+def negotiate_encoding(accept_encodings):
+    """Choisit le meilleur encodage supporté parmi ceux acceptés par le client."""
+    supported = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return accept_encodings.best_match(supported)
+
+
+def compress(data, encoding):
+    """Compresse des octets selon l'encodage négocié."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def compress_response(response):
+    """Hook after_request: compresse les réponses JSON si le client l'accepte."""
+    response.vary.add('Accept-Encoding')
+
+    if (response.direct_passthrough
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    encoding = negotiate_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -5,18 +5,64 @@ Utilise les features audio pour segmenter et classifier la musique.
 import librosa
 import numpy as np
 from scipy import signal
-from sklearn.cluster import KMeans
+
+
+# Seuils de classification des sections et de détection des drops
+# (partagés avec le moteur de reclassification par lots)
+CLASSIFICATION_THRESHOLDS = {
+    'intro_max_position': 0.15,   # Intro: début du morceau...
+    'low_energy': 0.03,           # ... et énergie faible (aussi seuil de l'outro)
+    'outro_min_position': 0.85,   # Outro / final chorus: fin du morceau
+    'final_chorus_energy': 0.08,
+    'loud_energy': 0.12,          # Très énergique et brillant: chorus ou drop
+    'loud_brightness': 2500,
+    'drop_energy': 0.15,
+    'chorus_energy': 0.08,
+    'chorus_brightness': 2000,
+    'variation': 0.015,           # Forte variation d'énergie: buildup / breakdown
+    'buildup_energy': 0.06,
+    'verse_min_energy': 0.05,
+    'verse_max_energy': 0.09,
+    'bridge_max_energy': 0.04,
+    'drop_peak_sigma': 2.0,       # Drops (pics RMS): moyenne + n·σ
+    'drop_min_distance': 8.0,     # Secondes minimum entre deux drops
+}
+
+
+def find_drop_peaks(rms, sr, hop_length, thresholds):
+    """
+    Pics d'énergie candidats aux drops.
+    
+    Partagée avec la reclassification par lots: la même enveloppe RMS donne
+    exactement les mêmes drops (égalités et plateaux compris).
+    
+    Args:
+        rms: Enveloppe RMS (float32, telle que produite par MusicAnalyzer)
+        sr, hop_length: Sample rate et hop de l'enveloppe
+        thresholds: Seuils (drop_peak_sigma, drop_min_distance)
+        
+    Returns:
+        numpy.ndarray: Indices des frames des drops
+    """
+    peaks, _ = signal.find_peaks(
+        rms,
+        height=np.mean(rms) + thresholds['drop_peak_sigma'] * np.std(rms),  # Seuil: moyenne + 2σ
+        distance=int(sr / hop_length * thresholds['drop_min_distance'])  # Min 8s entre drops
+    )
+    return peaks
 
 
 class SectionDetector:
     """Détecte et classifie les différentes sections d'un morceau."""
     
-    def __init__(self, n_sections=None):
+    def __init__(self, n_sections=None, thresholds=None):
         """
         Args:
             n_sections: Nombre approximatif de sections à détecter (None = auto)
+            thresholds: Seuils de classification (surcharge de CLASSIFICATION_THRESHOLDS)
         """
         self.n_sections = n_sections
+        self.thresholds = {**CLASSIFICATION_THRESHOLDS, **(thresholds or {})}
         self.min_section_duration = 8.0  # Durée minimale d'une section en secondes
     
     def detect_sections(self, features):
@@ -83,7 +129,7 @@ class SectionDetector:
             # Classifier la section
             section_type = self._classify_section(section_features, i, len(boundary_times) - 1)
             
-            sections.append({
+            section = {
                 'index': i,
                 'start': start,
                 'end': end,
@@ -95,7 +141,10 @@ class SectionDetector:
                 'brightness_variation': section_features['brightness_std'],
                 'bandwidth': section_features['bandwidth'],
                 'percussiveness': section_features['zcr']
-            })
+            }
+            if 'stereo_width' in section_features:
+                section['stereo_width'] = section_features['stereo_width']
+            sections.append(section)
         
         # 3. Post-traitement: affiner les classifications
         sections = self._refine_classifications(sections, features)
@@ -126,7 +175,7 @@ class SectionDetector:
         zcr_section = features['zero_crossing_rate'][start_frame:end_frame]
         chroma_section = features['chroma'][:, start_frame:end_frame]
         
-        return {
+        section_stats = {
             'energy': float(np.mean(rms_section)),
             'energy_std': float(np.std(rms_section)),
             'energy_max': float(np.max(rms_section)),
@@ -136,6 +185,12 @@ class SectionDetector:
             'zcr': float(np.mean(zcr_section)),
             'chroma_var': float(np.var(chroma_section))
         }
+        
+        # Largeur stéréo moyenne (analyse stéréo uniquement)
+        if 'stereo' in features:
+            section_stats['stereo_width'] = float(np.mean(features['stereo']['width'][start_frame:end_frame]))
+        
+        return section_stats
     
     def _classify_section(self, section_features, index, total_sections):
         """
@@ -154,33 +209,34 @@ class SectionDetector:
         energy = section_features['energy']
         brightness = section_features['brightness']
         energy_var = section_features['energy_std']
+        t = self.thresholds
         
         # Position relative dans le morceau
         position = index / total_sections
         
         # Intro (début du morceau, énergie faible)
-        if position < 0.15 and energy < 0.03:
+        if position < t['intro_max_position'] and energy < t['low_energy']:
             return 'intro'
         
         # Outro (fin du morceau)
-        if position > 0.85:
-            if energy < 0.03:
+        if position > t['outro_min_position']:
+            if energy < t['low_energy']:
                 return 'outro'
-            elif energy > 0.08:
+            elif energy > t['final_chorus_energy']:
                 return 'final_chorus'
         
         # Classifier selon l'énergie et la brillance
-        if energy > 0.12 and brightness > 2500:
+        if energy > t['loud_energy'] and brightness > t['loud_brightness']:
             # Très énergique et brillant
-            return 'drop' if energy > 0.15 else 'chorus'
-        elif energy > 0.08 and brightness > 2000:
+            return 'drop' if energy > t['drop_energy'] else 'chorus'
+        elif energy > t['chorus_energy'] and brightness > t['chorus_brightness']:
             return 'chorus'
-        elif energy_var > 0.015:
+        elif energy_var > t['variation']:
             # Forte variation d'énergie
-            return 'buildup' if energy > 0.06 else 'breakdown'
-        elif energy > 0.05 and energy < 0.09:
+            return 'buildup' if energy > t['buildup_energy'] else 'breakdown'
+        elif energy > t['verse_min_energy'] and energy < t['verse_max_energy']:
             return 'verse'
-        elif energy < 0.04:
+        elif energy < t['bridge_max_energy']:
             return 'bridge'
         else:
             return 'interlude'
@@ -229,14 +285,8 @@ class SectionDetector:
         Returns:
             list: Timestamps des drops détectés
         """
-        rms = features['rms']
-        
         # Détecter les pics d'énergie
-        peaks, properties = signal.find_peaks(
-            rms,
-            height=np.mean(rms) + 2 * np.std(rms),  # Seuil: moyenne + 2σ
-            distance=int(features['sr'] / features['hop_length'] * 8)  # Min 8s entre drops
-        )
+        peaks = find_drop_peaks(features['rms'], features['sr'], features['hop_length'], self.thresholds)
         
         drop_times = librosa.frames_to_time(
             peaks,
@@ -0,0 +1,229 @@
+"""
+Service de similarité entre morceaux.
+Construit un vecteur résumé de longueur fixe par analyse et recherche les
+plus proches voisins (cosinus) sur toute la bibliothèque en une opération
+matricielle.
+"""
+import threading
+
+import numpy as np
+
+
+N_MFCC = 13            # Coefficients MFCC retenus (13 en fast_mode, tronqués sinon)
+N_CHROMA = 12
+N_ENERGY_PROFILE = 16  # Points du profil d'énergie des sections (temps normalisé)
+
+# Poids par bloc, appliqués après standardisation: chaque bloc pèse
+# autant quel que soit son nombre de dimensions
+BLOCKS = {
+    'mfcc': (0, 2 * N_MFCC, 1.0),
+    'chroma': (2 * N_MFCC, 2 * N_MFCC + 2 * N_CHROMA, 0.8),
+    'tempo': (2 * N_MFCC + 2 * N_CHROMA, 2 * N_MFCC + 2 * N_CHROMA + 1, 0.6),
+    'spectral': (2 * N_MFCC + 2 * N_CHROMA + 1, 2 * N_MFCC + 2 * N_CHROMA + 3, 0.4),
+    'energy_profile': (2 * N_MFCC + 2 * N_CHROMA + 3, 2 * N_MFCC + 2 * N_CHROMA + 3 + N_ENERGY_PROFILE, 0.8),
+}
+VECTOR_SIZE = 2 * N_MFCC + 2 * N_CHROMA + 3 + N_ENERGY_PROFILE
+
+
+def build_summary_vector(features, sections):
+    """
+    Résume un morceau en un vecteur de longueur fixe.
+
+    Contenu: moyenne/écart-type des MFCC et du chroma, tempo, brillance et
+    bande passante moyennes, et profil d'énergie des sections ré-échantillonné
+    sur N_ENERGY_PROFILE points.
+
+    Args:
+        features: Features audio (de MusicAnalyzer, ou chargées de la bibliothèque)
+        sections: Sections (de SectionDetector)
+
+    Returns:
+        numpy.ndarray: Vecteur float32 de taille VECTOR_SIZE
+    """
+    mfcc = np.asarray(features['mfcc'], dtype=np.float32)[:N_MFCC]
+    chroma = np.asarray(features['chroma'], dtype=np.float32)
+
+    # Tempo en octaves (log2) pour que 120 et 128 BPM soient proches
+    tempo = np.log2(max(float(features['tempo']), 1.0) / 120.0)
+
+    spectral = [
+        np.mean(features['spectral_centroid']) / 1000.0,
+        np.mean(features['spectral_bandwidth']) / 1000.0,
+    ]
+
+    # Profil d'énergie: énergie de chaque section au milieu de son intervalle
+    if sections:
+        total = sections[-1]['end'] or 1.0
+        midpoints = np.array([(s['start'] + s['end']) / 2 for s in sections]) / total
+        energies = np.array([s['energy'] for s in sections])
+        grid = np.linspace(0.0, 1.0, N_ENERGY_PROFILE)
+        energy_profile = np.interp(grid, midpoints, energies)
+        energy_profile = energy_profile / (np.max(energy_profile) + 1e-9)
+    else:
+        energy_profile = np.zeros(N_ENERGY_PROFILE)
+
+    return np.concatenate([
+        mfcc.mean(axis=1), mfcc.std(axis=1),
+        chroma.mean(axis=1), chroma.std(axis=1),
+        [tempo],
+        spectral,
+        energy_profile,
+    ]).astype(np.float32)
+
+
+class SimilarityIndex:
+    """
+    Index des plus proches voisins sur les vecteurs résumés.
+
+    Les vecteurs sont standardisés (z-score par dimension), pondérés par
+    bloc puis normalisés L2: la similarité cosinus devient un simple produit
+    matrice-vecteur, suivi d'un argpartition pour le top-k. Quelques
+    millisecondes pour des dizaines de milliers de morceaux.
+
+    L'index suit la génération de la bibliothèque: seuls les vecteurs écrits
+    depuis la dernière lecture sont chargés. Les statistiques de
+    standardisation sont recalculées (en mémoire) quand la taille a varié de
+    plus de REFIT_GROWTH depuis le dernier calcul.
+    """
+
+    REFIT_GROWTH = 0.1
+
+    def __init__(self, library):
+        """
+        Args:
+            library: AnalysisLibrary source des vecteurs
+        """
+        self.library = library
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._version = None
+        self._ids = []
+        self._positions = {}
+        self._raw = np.zeros((0, VECTOR_SIZE), dtype=np.float32)
+        self._matrix = np.zeros((0, VECTOR_SIZE), dtype=np.float32)
+        self._fitted_size = 0
+        self._mean = np.zeros(VECTOR_SIZE, dtype=np.float32)
+        self._scale = np.ones(VECTOR_SIZE, dtype=np.float32)
+
+    def query(self, track_id, k=10):
+        """
+        Morceaux les plus proches d'un morceau de la bibliothèque.
+
+        Args:
+            track_id: Morceau de référence
+            k: Nombre de voisins
+
+        Returns:
+            list: [(track_id, score)] triés par similarité décroissante,
+                  ou None si le morceau n'est pas indexé
+        """
+        self._refresh()
+
+        with self._lock:
+            position = self._positions.get(track_id)
+            if position is None:
+                return None
+            return self._top_k(self._matrix[position], k, exclude=position)
+
+    def query_vector(self, vector, k=10):
+        """Morceaux les plus proches d'un vecteur résumé quelconque."""
+        self._refresh()
+
+        with self._lock:
+            if not self._ids:
+                return []
+            return self._top_k(self._normalize(np.asarray(vector, dtype=np.float32)[None, :])[0], k)
+
+    def size(self):
+        """Nombre de morceaux indexés."""
+        self._refresh()
+        return len(self._ids)
+
+    def _top_k(self, query, k, exclude=None):
+        """Top-k cosinus (verrou tenu)."""
+        scores = self._matrix @ query
+        if exclude is not None:
+            scores[exclude] = -np.inf
+
+        k = min(k, len(scores) - (1 if exclude is not None else 0))
+        if k <= 0:
+            return []
+
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(self._ids[i], float(scores[i])) for i in candidates]
+
+    def _refresh(self):
+        """Intègre les vecteurs écrits depuis la dernière lecture (autres workers inclus)."""
+        version = self.library.get_version()
+        if version == self._version:
+            return
+
+        with self._refresh_lock:
+            if version == self._version:
+                return
+
+            # Première lecture, ou bibliothèque recréée: rechargement complet
+            full = self._version is None or version < self._version
+            ids, raw = self.library.load_vectors(None if full else self._version)
+            if len(ids) and raw.shape[1] != VECTOR_SIZE:
+                ids, raw = [], np.zeros((0, VECTOR_SIZE), dtype=np.float32)
+
+            with self._lock:
+                if full:
+                    self._ids, self._positions = [], {}
+                    self._raw = np.zeros((0, VECTOR_SIZE), dtype=np.float32)
+                    self._matrix = np.zeros((0, VECTOR_SIZE), dtype=np.float32)
+                    self._fitted_size = 0
+                changed = self._merge(ids, raw)
+                self._version = version
+
+        if full:
+            print(f"🔎 Index de similarité chargé: {len(self._ids)} morceaux")
+        elif changed:
+            print(f"🔎 Index de similarité: {changed} vecteurs ajoutés ou mis à jour")
+
+    def _merge(self, ids, raw):
+        """
+        Ajoute ou remplace des vecteurs bruts (verrou tenu).
+
+        Returns:
+            int: Nombre de vecteurs intégrés
+        """
+        if not ids:
+            return 0
+
+        updated = [(self._positions[track_id], i) for i, track_id in enumerate(ids) if track_id in self._positions]
+        added = [i for i, track_id in enumerate(ids) if track_id not in self._positions]
+
+        raw = raw.astype(np.float32)
+        if updated:
+            positions, rows = map(list, zip(*updated))
+            self._raw[positions] = raw[rows]
+        if added:
+            for i in added:
+                self._positions[ids[i]] = len(self._ids)
+                self._ids.append(ids[i])
+            self._raw = np.concatenate([self._raw, raw[added]])
+
+        size = len(self._ids)
+        if size > 1 and abs(size - self._fitted_size) > self.REFIT_GROWTH * self._fitted_size:
+            # Statistiques recalculées sur tout l'index (en mémoire, sans relecture SQLite)
+            self._mean = self._raw.mean(axis=0)
+            self._scale = self._raw.std(axis=0) + 1e-6
+            self._fitted_size = size
+            self._matrix = self._normalize(self._raw)
+        else:
+            touched = np.array([position for position, _ in updated] + list(range(size - len(added), size)), dtype=int)
+            if len(self._matrix) < size:
+                self._matrix = np.concatenate([self._matrix, np.zeros((size - len(self._matrix), VECTOR_SIZE), dtype=np.float32)])
+            self._matrix[touched] = self._normalize(self._raw[touched])
+        return len(ids)
+
+    def _normalize(self, vectors):
+        """Standardisation, pondération par bloc et normalisation L2."""
+        normalized = (vectors - self._mean) / self._scale
+        for start, end, weight in BLOCKS.values():
+            normalized[:, start:end] *= weight / np.sqrt(end - start)
+        norms = np.linalg.norm(normalized, axis=1, keepdims=True)
+        return (normalized / (norms + 1e-9)).astype(np.float32)
@@ -3,6 +3,8 @@ Service de mapping entre sections musicales et configurations de visualiseurs.
 """
 import random
 
+import numpy as np
+
 
 class VisualizerMapper:
     """Mappe les sections musicales aux configurations de visualiseurs."""
@@ -148,6 +150,85 @@ class VisualizerMapper:
         
         return timeline
     
+    def get_beat_keyframes(self, timeline, features, transition_beats=4):
+        """
+        Précalcule une piste de keyframes, une par beat, pour la lecture côté client.
+        
+        Chaque keyframe porte l'opacité, le blur et l'intensité interpolés
+        ainsi que le crossfade vers la paire de shaders de la section suivante
+        (sur `transition_beats` beats avant un point de transition, un seul
+        beat pour les autres changements de section). Les colonnes sont alignées
+        sur `beat_times` (même indice, temps non répétés): le client cherche le
+        beat courant dans `beat_times` puis lit la keyframe au même indice.
+        
+        `beat_in_bar` est une estimation (mesure à 4 temps): la phase retenue
+        est celle dont les beats sont en moyenne les plus énergiques.
+        
+        Args:
+            timeline: Timeline de visualisation (de get_visualization_timeline)
+            features: Features audio (de MusicAnalyzer): beat_times, rms, sr, hop_length, tempo
+            transition_beats: Durée du crossfade aux points de transition (en beats)
+            
+        Returns:
+            dict: Colonnes de même longueur que beat_times (section, next_section,
+                  crossfade, opacity, blur_amount, intensity, beat_in_bar)
+        """
+        columns = ['section', 'next_section', 'crossfade',
+                   'opacity', 'blur_amount', 'intensity', 'beat_in_bar']
+        beats = np.asarray(features.get('beat_times', []), dtype=np.float64)
+        if not timeline or len(beats) == 0:
+            return {name: [] for name in columns}
+        
+        tempo = features.get('tempo') or 120.0
+        beat_period = 60.0 / tempo
+        
+        starts = np.array([entry['time'] for entry in timeline])
+        ends = starts + np.array([entry['duration'] for entry in timeline])
+        opacities = np.array([entry['opacity'] for entry in timeline])
+        blurs = np.array([entry['blur_amount'] for entry in timeline])
+        energies = np.array([entry['energy'] for entry in timeline])
+        transitions = np.array([entry['is_transition'] for entry in timeline])
+        
+        # Section courante et suivante pour chaque beat
+        last = len(timeline) - 1
+        section = np.clip(np.searchsorted(starts, beats, side='right') - 1, 0, last)
+        next_section = np.minimum(section + 1, last)
+        has_next = next_section != section
+        
+        # Crossfade linéaire vers la section suivante avant sa frontière
+        fade_length = np.where(transitions[next_section], transition_beats, 1) * beat_period
+        remaining = ends[section] - beats
+        crossfade = np.where(has_next, np.clip(1.0 - remaining / fade_length, 0.0, 1.0), 0.0)
+        
+        opacity = (1.0 - crossfade) * opacities[section] + crossfade * opacities[next_section]
+        blur = (1.0 - crossfade) * blurs[section] + crossfade * blurs[next_section]
+        
+        # Enveloppe d'énergie échantillonnée sur les beats
+        rms = np.asarray(features['rms'], dtype=np.float64)
+        frame_times = np.arange(len(rms)) * features['hop_length'] / features['sr']
+        beat_energy = np.interp(beats, frame_times, rms)
+        intensity = np.clip(beat_energy / (np.max(rms) + 1e-9), 0.0, 1.0)
+        
+        # Accentuer les beats plus forts que la moyenne de leur section
+        accent = np.clip(beat_energy / (energies[section] + 1e-9), 0.5, 1.5)
+        opacity = np.clip(opacity * (0.85 + 0.15 * accent), 0.2, 0.95)
+        blur = np.clip(blur * (1.1 - 0.1 * accent), 1.0, 6.0)
+        
+        # Position dans la mesure: premier temps = phase la plus accentuée
+        indices = np.arange(len(beats))
+        phase_energy = [beat_energy[phase::4].mean() if phase < len(beats) else -np.inf for phase in range(4)]
+        beat_in_bar = (indices - int(np.argmax(phase_energy))) % 4
+        
+        return {
+            'section': section.tolist(),
+            'next_section': next_section.tolist(),
+            'crossfade': np.round(crossfade, 3).tolist(),
+            'opacity': np.round(opacity, 3).tolist(),
+            'blur_amount': np.round(blur, 2).tolist(),
+            'intensity': np.round(intensity, 3).tolist(),
+            'beat_in_bar': beat_in_bar.tolist()
+        }
+    
     def _adjust_config_to_energy(self, config, energy, brightness):
         """Ajuste la configuration selon l'énergie réelle de la section."""
         
@@ -0,0 +1,112 @@
+"""
+Service de préchauffage du pipeline d'analyse.
+Importe librosa/scipy et compile les noyaux numba sur un signal synthétique
+avant que le worker n'accepte du trafic.
+"""
+import os
+import threading
+import time
+
+
+# Instant de démarrage du processus (approximé au premier import de ce module)
+PROCESS_START = time.time()
+
+_lock = threading.Lock()
+_stats = {
+    'process_start': PROCESS_START,
+    'import_seconds': None,
+    'warmup_seconds': None,
+    'warmed_up': False,
+    'warmup_pid': None,
+    'first_request_seconds': None,
+    'first_request_after_start': None,
+}
+
+
+def make_warmup_signal(sr=22050, duration=10.0, bpm=120.0):
+    """
+    Génère un signal synthétique court (clics sur le temps + accord tenu).
+
+    Args:
+        sr: Sample rate
+        duration: Durée en secondes
+        bpm: Tempo des clics
+
+    Returns:
+        numpy.ndarray: Signal mono float32
+    """
+    import numpy as np
+
+    t = np.arange(int(sr * duration)) / sr
+    y = 0.1 * (np.sin(2 * np.pi * 220 * t) + np.sin(2 * np.pi * 330 * t))
+
+    # Clics percussifs sur chaque temps, plus forts en seconde moitié
+    click_length = int(0.02 * sr)
+    envelope = np.exp(-np.linspace(0, 8, click_length))
+    for beat_time in np.arange(0, duration, 60.0 / bpm):
+        start = int(beat_time * sr)
+        end = min(len(y), start + click_length)
+        gain = 0.5 if beat_time < duration / 2 else 0.9
+        y[start:end] += gain * envelope[:end - start] * np.random.uniform(-1, 1, end - start)
+
+    return y.astype(np.float32)
+
+
+def warm_up(sr=22050):
+    """
+    Importe les dépendances lourdes et exécute le pipeline complet une fois.
+
+    Appelé dans le master gunicorn (preload_app) pour que les workers forkés
+    héritent des modules et du code numba déjà compilés, ou dans chaque worker
+    avant qu'il n'accepte des connexions.
+
+    Returns:
+        dict: Statistiques de démarrage
+    """
+    with _lock:
+        if _stats['warmed_up'] and _stats['warmup_pid'] == os.getpid():
+            return dict(_stats)
+
+        import_start = time.time()
+        from app.services.music_analyzer import MusicAnalyzer
+        from app.services.section_detector import SectionDetector
+        from app.services.visualizer_mapper import VisualizerMapper
+        _stats['import_seconds'] = time.time() - import_start
+
+        warmup_start = time.time()
+        y = make_warmup_signal(sr=sr)
+        features = MusicAnalyzer(sr=sr, fast_mode=True).analyze_signal(y, sr)
+        detector = SectionDetector(n_sections=4)
+        sections = detector.detect_sections(features)
+        detector.detect_drops(features, sections)
+        mapper = VisualizerMapper()
+        timeline = mapper.get_visualization_timeline(sections, features['tempo'])
+        mapper.get_beat_keyframes(timeline, features)
+        _stats['warmup_seconds'] = time.time() - warmup_start
+
+        _stats['warmed_up'] = True
+        _stats['warmup_pid'] = os.getpid()
+
+        print("🔥 Warm-up terminé: imports {:.2f}s, pipeline {:.2f}s (pid {})".format(
+            _stats['import_seconds'], _stats['warmup_seconds'], os.getpid()
+        ))
+        return dict(_stats)
+
+
+def record_request(elapsed):
+    """Enregistre la latence de la première analyse complète servie par ce processus."""
+    with _lock:
+        if _stats['first_request_seconds'] is not None:
+            return
+        _stats['first_request_seconds'] = elapsed
+        _stats['first_request_after_start'] = time.time() - PROCESS_START
+    print("⏱️ Première analyse du worker {}: {:.2f}s".format(os.getpid(), elapsed))
+
+
+def get_stats():
+    """Statistiques de démarrage à froid et de première requête."""
+    with _lock:
+        stats = dict(_stats)
+    stats['pid'] = os.getpid()
+    stats['uptime'] = time.time() - PROCESS_START
+    return stats
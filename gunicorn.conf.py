@@ -0,0 +1,33 @@
+# Configuration Gunicorn pour Analify
+# Chargée automatiquement par gunicorn (./gunicorn.conf.py); les options passées
+# en ligne de commande (Procfile, railway.json...) restent prioritaires.
+import os
+
+# Cache disque numba: les noyaux librosa compilés survivent aux redémarrages
+os.environ.setdefault('NUMBA_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp', 'numba_cache'))
+
+# Charger l'application dans le master: librosa/scipy/numba sont importés une
+# seule fois puis partagés par les workers via fork (copy-on-write)
+preload_app = os.environ.get('PRELOAD_APP', '1') != '0'
+
+# Préchauffer le pipeline d'analyse avant d'accepter du trafic
+WARMUP = os.environ.get('ANALYSIS_WARMUP', '1') != '0'
+
+
+def when_ready(server):
+    """Master prêt, workers pas encore forkés: préchauffage partagé."""
+    if WARMUP and server.cfg.preload_app:
+        from app.services.warmup import warm_up
+        warm_up()
+
+
+def post_worker_init(worker):
+    """Application chargée dans le worker, avant d'accepter des connexions."""
+    # La file d'admission doit tenir dans les threads du worker
+    from app.controllers.analyzecontroller import admission_controller
+    admission_controller.configure_threads(worker.cfg.threads)
+
+    # Sans preload, chaque worker se préchauffe lui-même
+    if WARMUP and not worker.cfg.preload_app:
+        from app.services.warmup import warm_up
+        warm_up()
@@ -0,0 +1,530 @@
+"""
+Banc de charge local pour /api/analyze.
+
+Démarre l'application avec la commande gunicorn du Procfile, envoie un mélange
+d'uploads synthétiques (durées et formats variés) à concurrence fixée, puis
+rapporte débit, latences p50/p95/p99, taux d'erreur / de mode dégradé / de
+rejet 503 et pic de RSS par worker. Fonctionne entièrement hors ligne.
+
+Exemples:
+    python loadtest.py --requests 40 --concurrency 8
+    python loadtest.py --mix wav:30,wav:180,flac:120 --output before.json
+    python loadtest.py --compare before.json --output after.json
+"""
+import argparse
+import io
+import json
+import os
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+DEFAULT_MIX = 'wav:30,wav:120,wav:240,flac:180,ogg:180,mp3:240'
+SAMPLE_RATE = 44100
+
+
+# ---------------------------------------------------------------------------
+# Génération des uploads synthétiques
+# ---------------------------------------------------------------------------
+
+def synth_track(duration, seed, sr=SAMPLE_RATE):
+    """
+    Génère un morceau synthétique stéréo (pad + kick, énergie variable par sections).
+
+    Returns:
+        numpy.ndarray: Signal float32 de forme (n, 2)
+    """
+    rng = np.random.default_rng(seed)
+    bpm = rng.uniform(90, 140)
+    t = np.arange(int(duration * sr)) / sr
+
+    # Enveloppe de sections: énergie variable tous les ~20s
+    n_sections = max(2, int(duration // 20))
+    levels = rng.uniform(0.2, 1.0, n_sections)
+    section_energy = levels[np.minimum((t / duration * n_sections).astype(int), n_sections - 1)]
+
+    root = rng.choice([110.0, 130.8, 146.8, 164.8])
+    pad = np.sin(2 * np.pi * root * t) + 0.5 * np.sin(2 * np.pi * root * 1.5 * t)
+
+    # Kick sur chaque temps (sinus descendant amorti)
+    beat_phase = (t * bpm / 60.0) % 1.0
+    kick = np.sin(2 * np.pi * 60 * beat_phase) * np.exp(-beat_phase * 12)
+
+    noise = rng.normal(0, 0.05, len(t)) * section_energy
+    mono = 0.2 * pad * section_energy + 0.6 * kick * section_energy + noise
+
+    # Légère différence gauche/droite pour les analyses stéréo
+    pan = 0.5 + 0.3 * np.sin(2 * np.pi * t / 8.0)
+    stereo = np.stack([mono * (1.0 - pan + 0.5), mono * (pan + 0.5)], axis=1)
+    stereo /= np.max(np.abs(stereo)) + 1e-9
+    return (0.8 * stereo).astype(np.float32)
+
+
+def encode_wav(signal_data, sr=SAMPLE_RATE):
+    """Encode en WAV PCM 16 bits (bibliothèque standard)."""
+    pcm = (signal_data * 32767).astype('<i2')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(signal_data.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(sr)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def encode_track(signal_data, fmt, sr=SAMPLE_RATE):
+    """
+    Encode un signal dans le format demandé.
+
+    wav: bibliothèque standard; flac/ogg: soundfile; mp3/m4a/aac: ffmpeg.
+
+    Returns:
+        bytes ou None si aucun encodeur n'est disponible
+    """
+    if fmt == 'wav':
+        return encode_wav(signal_data, sr)
+
+    if fmt in ('flac', 'ogg'):
+        try:
+            import soundfile
+        except ImportError:
+            soundfile = None
+        if soundfile is not None:
+            buffer = io.BytesIO()
+            subtype = 'VORBIS' if fmt == 'ogg' else 'PCM_16'
+            soundfile.write(buffer, signal_data, sr, format=fmt.upper(), subtype=subtype)
+            return buffer.getvalue()
+
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-loglevel', 'error', '-f', 'wav', '-i', 'pipe:0', '-f',
+             {'m4a': 'ipod', 'aac': 'adts'}.get(fmt, fmt), 'pipe:1'],
+            input=encode_wav(signal_data, sr), capture_output=True, check=True
+        )
+        return result.stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_payloads(mix, seed):
+    """
+    Prépare les uploads du mélange (générés une fois, déterministes).
+
+    Args:
+        mix: Liste de (format, durée)
+        seed: Graine de génération
+
+    Returns:
+        list: Dictionnaires {name, format, duration, data}
+    """
+    payloads = []
+    for i, (fmt, duration) in enumerate(mix):
+        data = encode_track(synth_track(duration, seed + i), fmt)
+        if data is None:
+            print(f"⚠️ Pas d'encodeur pour {fmt}, ignoré")
+            continue
+        payloads.append({
+            'name': f"synth_{i}_{int(duration)}s.{fmt}",
+            'format': fmt,
+            'duration': duration,
+            'data': data,
+        })
+        print(f"  {payloads[-1]['name']}: {len(data) / 1e6:.1f} Mo")
+    return payloads
+
+
+def describe_payloads(payloads):
+    """Uploads effectivement envoyés (sans les données), pour le rapport."""
+    return [
+        {'name': p['name'], 'format': p['format'], 'duration': p['duration'], 'bytes': len(p['data'])}
+        for p in payloads
+    ]
+
+
+def check_comparable(report_payloads, previous):
+    """
+    Vérifie qu'un rapport précédent a été produit avec les mêmes uploads.
+
+    Returns:
+        str ou None: Description de l'écart, None si comparable
+    """
+    previous_payloads = previous.get('config', {}).get('payloads')
+    if previous_payloads is None:
+        return "le rapport précédent ne décrit pas ses uploads"
+    if previous_payloads == report_payloads:
+        return None
+
+    def label(payloads):
+        return ', '.join(f"{p['name']} ({p['bytes']} o)" for p in payloads) or 'aucun'
+
+    return f"uploads différents:\n  précédent: {label(previous_payloads)}\n  actuel:    {label(report_payloads)}"
+
+
+def parse_mix(mix):
+    """Parse 'wav:30,mp3:240' en [('wav', 30.0), ('mp3', 240.0)]."""
+    entries = []
+    for item in mix.split(','):
+        fmt, duration = item.strip().split(':')
+        entries.append((fmt.lower(), float(duration)))
+    return entries
+
+
+# ---------------------------------------------------------------------------
+# Serveur gunicorn
+# ---------------------------------------------------------------------------
+
+def production_command(port, procfile='Procfile'):
+    """Commande gunicorn du Procfile, avec le port substitué."""
+    with open(procfile) as f:
+        for line in f:
+            if line.startswith('web:'):
+                command = line[len('web:'):].strip().replace('$PORT', str(port))
+                return shlex.split(command)
+    raise RuntimeError(f"Aucune ligne 'web:' dans {procfile}")
+
+
+def free_port():
+    """Trouve un port TCP libre en local."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(command, base_url, log_path, env=None, timeout=300):
+    """Démarre gunicorn (sortie dans log_path) et attend qu'il réponde sur '/'."""
+    print(f"Démarrage: {' '.join(command)} (logs: {log_path})")
+    os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+    with open(log_path, 'wb') as log:
+        process = subprocess.Popen(
+            command,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            env=env,
+            start_new_session=True,
+        )
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(
+                f"gunicorn s'est arrêté (code {process.returncode}), fin des logs:\n{tail(log_path)}"
+            )
+        try:
+            urllib.request.urlopen(base_url + '/', timeout=2)
+            return process
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+
+    stop_server(process)
+    raise RuntimeError(f"gunicorn ne répond pas, fin des logs:\n{tail(log_path)}")
+
+
+def tail(path, n_lines=20):
+    """Dernières lignes d'un fichier de logs."""
+    try:
+        with open(path, errors='replace') as f:
+            return ''.join(f.readlines()[-n_lines:])
+    except OSError:
+        return ''
+
+
+def stop_server(process):
+    """Arrête gunicorn et ses workers."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+class RSSMonitor(threading.Thread):
+    """Échantillonne le RSS des workers gunicorn via /proc (Linux)."""
+
+    def __init__(self, master_pid, interval=0.2):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peaks = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            for pid in self._worker_pids():
+                rss = self._rss_mb(pid)
+                if rss is not None:
+                    self.peaks[pid] = max(self.peaks.get(pid, 0.0), rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def _worker_pids(self):
+        try:
+            with open(f"/proc/{self.master_pid}/task/{self.master_pid}/children") as f:
+                return [int(pid) for pid in f.read().split()]
+        except OSError:
+            pass
+
+        # Noyau sans /proc/.../children: parcourir les ppid
+        pids = []
+        for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if ppid == self.master_pid:
+                pids.append(int(entry))
+        return pids
+
+    @staticmethod
+    def _rss_mb(pid):
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Charge
+# ---------------------------------------------------------------------------
+
+def post_upload(url, payload, timeout, declare_duration=False):
+    """
+    Envoie un upload multipart et mesure la latence.
+
+    Le header X-Audio-Duration n'est envoyé qu'avec declare_duration: le
+    client web ne l'envoie pas, l'admission se fait alors sur la taille.
+    """
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        f"--{boundary}\r\n".encode(),
+        f'Content-Disposition: form-data; name="audio"; filename="{payload["name"]}"\r\n'.encode(),
+        b"Content-Type: application/octet-stream\r\n\r\n",
+        payload['data'],
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    headers = {'Content-Type': f"multipart/form-data; boundary={boundary}"}
+    if declare_duration:
+        headers['X-Audio-Duration'] = str(payload['duration'])
+    http_request = urllib.request.Request(url, data=body, method='POST', headers=headers)
+
+    start = time.time()
+    result = {'format': payload['format'], 'duration': payload['duration']}
+    try:
+        with urllib.request.urlopen(http_request, timeout=timeout) as response:
+            data = json.loads(response.read())
+            result['status'] = response.status
+            result['degraded'] = bool(data.get('degraded_mode'))
+    except urllib.error.HTTPError as e:
+        result['status'] = e.code
+        result['degraded'] = False
+    except (urllib.error.URLError, OSError) as e:
+        result['status'] = None
+        result['degraded'] = False
+        result['error'] = str(e)
+    result['latency'] = time.time() - start
+    return result
+
+
+def run_load(url, payloads, n_requests, concurrency, timeout, declare_duration=False):
+    """Envoie n_requests uploads (round-robin sur le mélange) à concurrence fixe."""
+    schedule = [payloads[i % len(payloads)] for i in range(n_requests)]
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(
+            lambda payload: post_upload(url, payload, timeout, declare_duration), schedule
+        ))
+    return results, time.time() - start
+
+
+def summarize(results, wall_time, rss_peaks):
+    """Agrège les résultats en rapport."""
+    latencies = np.array([r['latency'] for r in results])
+    ok = [r for r in results if r['status'] == 200]
+    # Le mode dégradé répond vite sans analyser: exclu des percentiles
+    analyzed_latencies = np.array([r['latency'] for r in ok if not r['degraded']])
+    total = max(len(results), 1)
+
+    def percentile(q):
+        if len(analyzed_latencies) == 0:
+            return None
+        return round(float(np.percentile(analyzed_latencies, q)), 3)
+
+    return {
+        'requests': len(results),
+        'wall_time': round(wall_time, 2),
+        'throughput_rps': round(len(ok) / wall_time, 3) if wall_time > 0 else 0.0,
+        'audio_seconds_per_second': round(sum(r['duration'] for r in ok) / wall_time, 2) if wall_time > 0 else 0.0,
+        # Percentiles calculés sur les analyses complètes (200 hors mode dégradé):
+        # les rejets 503 et les réponses dégradées sont rapides par construction
+        'latency': {
+            'p50': percentile(50),
+            'p95': percentile(95),
+            'p99': percentile(99),
+            'max_all': round(float(latencies.max()), 3) if len(latencies) else None,
+        },
+        'rates': {
+            'success': round(len(ok) / total, 3),
+            'degraded': round(sum(r['degraded'] for r in ok) / total, 3),
+            'rejected_503': round(sum(r['status'] == 503 for r in results) / total, 3),
+            'error': round(sum(r['status'] not in (200, 503) for r in results) / total, 3),
+        },
+        'status_codes': {
+            str(code): sum(r['status'] == code for r in results)
+            for code in sorted({r['status'] for r in results}, key=str)
+        },
+        'worker_peak_rss_mb': {str(pid): round(rss, 1) for pid, rss in sorted(rss_peaks.items())},
+    }
+
+
+def git_revision():
+    """Révision git courante (pour comparer les rapports)."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, previous=None):
+    """Affiche le rapport, avec les écarts vs un rapport précédent."""
+    summary = report['summary']
+
+    def delta(path):
+        if previous is None:
+            return ''
+        old = previous['summary']
+        new = summary
+        for key in path:
+            old, new = old.get(key, {}), new.get(key, {})
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+            return ''
+        return f"  ({new - old:+.3f} vs {previous.get('revision')})"
+
+    print(f"\n{'='*60}")
+    print(f"Révision: {report['revision']} | {report['config']['command']}")
+    print(f"Requêtes: {summary['requests']} | Concurrence: {report['config']['concurrency']}")
+    print(f"Débit: {summary['throughput_rps']} req/s{delta(['throughput_rps'])}")
+    print(f"Audio traité: {summary['audio_seconds_per_second']} s/s{delta(['audio_seconds_per_second'])}")
+    for key in ('p50', 'p95', 'p99'):
+        print(f"Latence {key}: {summary['latency'][key]}s{delta(['latency', key])}")
+    for key, value in summary['rates'].items():
+        print(f"Taux {key}: {value:.1%}{delta(['rates', key])}")
+    for pid, rss in summary['worker_peak_rss_mb'].items():
+        print(f"Pic RSS worker {pid}: {rss} Mo")
+    print(f"{'='*60}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de charge local pour /api/analyze")
+    parser.add_argument('--requests', type=int, default=24, help="Nombre total de requêtes")
+    parser.add_argument('--concurrency', type=int, default=4, help="Requêtes simultanées")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Mélange format:durée, séparé par des virgules")
+    parser.add_argument('--seed', type=int, default=1234, help="Graine des signaux synthétiques")
+    parser.add_argument('--timeout', type=float, default=330, help="Timeout client par requête (s)")
+    parser.add_argument('--procfile', default='Procfile', help="Procfile d'où lire la commande gunicorn")
+    parser.add_argument('--url', default=None, help="Cibler un serveur déjà lancé au lieu de démarrer gunicorn")
+    parser.add_argument('--output', default=None, help="Fichier JSON de rapport")
+    parser.add_argument('--compare', default=None, help="Rapport JSON précédent à comparer")
+    parser.add_argument('--declare-duration', action='store_true',
+                        help="Envoyer X-Audio-Duration (le client web ne l'envoie pas)")
+    parser.add_argument('--server-log', default=os.path.join('temp', 'loadtest_gunicorn.log'),
+                        help="Fichier de logs de gunicorn")
+    args = parser.parse_args()
+    if args.requests < 1 or args.concurrency < 1:
+        sys.exit("--requests et --concurrency doivent être >= 1")
+
+    mix = parse_mix(args.mix)
+    print("Génération des uploads synthétiques...")
+    payloads = build_payloads(mix, args.seed)
+    if not payloads:
+        sys.exit("Aucun upload généré")
+
+    # Les formats sans encodeur sont ignorés: ne comparer qu'à mélange identique
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        mismatch = check_comparable(describe_payloads(payloads), previous)
+        if not mismatch and previous['config'].get('declare_duration', False) != args.declare_duration:
+            mismatch = "X-Audio-Duration envoyé dans un seul des deux rapports (--declare-duration)"
+        if mismatch:
+            sys.exit(f"Rapports non comparables ({args.compare}): {mismatch}")
+
+    process = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+        command = None
+    else:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        command = production_command(port, args.procfile)
+        # Bibliothèque jetable: les morceaux synthétiques ne polluent pas library/
+        library_folder = tempfile.mkdtemp(prefix='loadtest_library_')
+        env = dict(os.environ, LIBRARY_FOLDER=library_folder)
+        process = start_server(command, base_url, args.server_log, env=env)
+
+    monitor = RSSMonitor(process.pid) if process else None
+    try:
+        if monitor:
+            monitor.start()
+        print(f"Charge: {args.requests} requêtes, concurrence {args.concurrency}...")
+        results, wall_time = run_load(
+            base_url + '/api/analyze', payloads, args.requests, args.concurrency, args.timeout,
+            args.declare_duration
+        )
+    finally:
+        if monitor:
+            monitor.stop()
+        if process:
+            stop_server(process)
+            shutil.rmtree(library_folder, ignore_errors=True)
+
+    report = {
+        'revision': git_revision(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'command': ' '.join(command) if command else base_url,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'mix': args.mix,
+            'seed': args.seed,
+            'payloads': describe_payloads(payloads),
+            'declare_duration': args.declare_duration,
+        },
+        'summary': summarize(results, wall_time, monitor.peaks if monitor else {}),
+    }
+
+    print_report(report, previous)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Rapport écrit: {args.output}")
+
+
+if __name__ == '__main__':
+    main()